@@ -3,27 +3,30 @@ from flask import Flask
 from flask_mail import Mail
 from flask_admin import Admin, AdminIndexView, expose
 from flask_admin.contrib.sqla import ModelView
-from sqlalchemy import create_engine
-from sqlalchemy.orm import scoped_session, sessionmaker
-from bcrypt import hashpw, gensalt
-import ulid
 import os
 from datetime import datetime
 from wtforms import validators
 from wtforms.fields import StringField, PasswordField
 from wtforms.widgets import PasswordInput
 from wtforms import SelectField
-from app.database import get_db, init_db
+from app.database import (get_db, init_db as inicializar_banco, Base,
+                          DATABASE_URL, TEST_DATABASE_URL, engine, test_engine, Session, TestSession,
+                          fabrica_sessoes, fabrica_sessoes_teste, encerrar_sessoes, SessaoRoteada, ler_pragmas, checkpoint_wal, otimizar_sqlite)
 from app.models.company import PendingCompany
 from app.models.user import PendingUser
-
-# Configuração do banco de dados
-DATABASE_URL = 'sqlite:///database.db'
-TEST_DATABASE_URL = 'sqlite:///test_database.db'
-test_engine = create_engine(TEST_DATABASE_URL)
-engine = create_engine(DATABASE_URL)
-Session = scoped_session(sessionmaker(bind=engine))
-TestSession = scoped_session(sessionmaker(bind=test_engine))
+from app.models.exam_stats import reconstruir_agregados
+from app.search import reconstruir_indice_busca
+from app.cache import cache_entidades
+from app.autocomplete import autocomplete
+from app.passwords import servico_senhas, gerar_hash_senha, calibrar_custo
+import click
+from app.rate_limit import limitador, ler_regra, arquivo_limites
+from app.auth import cache_tokens, cache_principais
+from app.models.refresh_token import remover_refresh_expirados
+from app.mailer import enviador_emails
+from app.scheduler import agendador
+from app.models.pending import remover_pendentes_expirados, TIPOS_PENDENTES
+from app.ids import novo_ulid, migrar_ids_binarios
 
 # Configuração do Flask-Mail
 mail = Mail()
@@ -47,8 +50,45 @@ def create_app(testing=False):
         app.config['TESTING'] = True
         app.config['SQLALCHEMY_DATABASE_URI'] = TEST_DATABASE_URL
         app.config['SECRET_KEY'] = 'chave_teste'
+    # Engine e pool vêm do ambiente (DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_ECHO)
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', DATABASE_URL)
     mail.init_app(app)
 
+    # Cache das respostas de obter (entradas e segundos de validade)
+    app.config.setdefault('CACHE_ENTIDADES_TAMANHO', int(os.environ.get('CACHE_ENTIDADES_TAMANHO', 1024)))
+    app.config.setdefault('CACHE_ENTIDADES_TTL', int(os.environ.get('CACHE_ENTIDADES_TTL', 60)))
+    cache_entidades.configurar(app.config['CACHE_ENTIDADES_TAMANHO'], app.config['CACHE_ENTIDADES_TTL'])
+
+    # Pool do bcrypt: threads (padrão: núcleos), chamadas aguardando na fila, espera máxima em segundos
+    # e custo (work factor) dos novos hashes; use `flask calibrar-senhas` para escolher o custo
+    app.config.setdefault('SENHAS_TRABALHADORES', int(os.environ.get('SENHAS_TRABALHADORES', 0)) or None)
+    app.config.setdefault('SENHAS_FILA_MAXIMA', int(os.environ.get('SENHAS_FILA_MAXIMA', 32)))
+    app.config.setdefault('SENHAS_ESPERA_MAXIMA', float(os.environ.get('SENHAS_ESPERA_MAXIMA', 10)))
+    app.config.setdefault('SENHAS_CUSTO', int(os.environ.get('SENHAS_CUSTO', 12)))
+    servico_senhas.configurar(app.config['SENHAS_TRABALHADORES'], app.config['SENHAS_FILA_MAXIMA'],
+                              app.config['SENHAS_ESPERA_MAXIMA'], app.config['SENHAS_CUSTO'])
+
+    # Limites de login/registro: "capacidade,fichas por minuto" por IP e por e-mail, em um
+    # arquivo SQLite compartilhado pelos workers do host
+    # (os testes usam um arquivo próprio do processo, nunca o compartilhado)
+    app.config.setdefault('LIMITE_TENTATIVAS_ATIVO', os.environ.get('LIMITE_TENTATIVAS_ATIVO', '1') == '1')
+    if testing:
+        app.config['LIMITE_TENTATIVAS_ARQUIVO'] = arquivo_limites(testing=True)
+    app.config.setdefault('LIMITE_TENTATIVAS_ARQUIVO', os.environ.get('LIMITE_TENTATIVAS_ARQUIVO', arquivo_limites()))
+    app.config.setdefault('LIMITE_TENTATIVAS_IP', ler_regra(os.environ.get('LIMITE_TENTATIVAS_IP', '20,10')))
+    app.config.setdefault('LIMITE_TENTATIVAS_CONTA', ler_regra(os.environ.get('LIMITE_TENTATIVAS_CONTA', '5,5')))
+    limitador.configurar(app.config['LIMITE_TENTATIVAS_ARQUIVO'],
+                         {'ip': app.config['LIMITE_TENTATIVAS_IP'], 'conta': app.config['LIMITE_TENTATIVAS_CONTA']},
+                         app.config['LIMITE_TENTATIVAS_ATIVO'])
+
+    # Autenticação: tokens verificados ficam em memória até expirar; as contas carregadas
+    # por AUTH_CACHE_TTL segundos (alterações feitas no próprio worker invalidam na hora)
+    app.config.setdefault('AUTH_CACHE_TAMANHO', int(os.environ.get('AUTH_CACHE_TAMANHO', 4096)))
+    app.config.setdefault('AUTH_CACHE_TTL', int(os.environ.get('AUTH_CACHE_TTL', 300)))
+    cache_tokens.configurar(app.config['AUTH_CACHE_TAMANHO'], cache_tokens.ttl)
+    cache_principais.configurar(app.config['AUTH_CACHE_TAMANHO'], app.config['AUTH_CACHE_TTL'])
+    app.config.setdefault('REFRESH_TOKEN_DIAS', int(os.environ.get('REFRESH_TOKEN_DIAS', 30)))
+
     # Configuração do diretório de upload de imagens
     UPLOAD_FOLDER = 'uploads'
     app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, UPLOAD_FOLDER)
@@ -86,7 +126,7 @@ def create_app(testing=False):
         def on_model_change(self, form, model, is_created):
             if is_created:
                 if not model.id:
-                    model.id = str(ulid.new())
+                    model.id = novo_ulid()
                 model.created_at = datetime.utcnow()
             model.updated_at = datetime.utcnow()
             return super(BaseModelView, self).on_model_change(form, model, is_created)
@@ -124,7 +164,7 @@ def create_app(testing=False):
 
             # Processar a senha
             if hasattr(form, 'password') and form.password.data:
-                model.password_hash = hashpw(form.password.data.encode('utf-8'), gensalt()).decode('utf-8')
+                model.password_hash = gerar_hash_senha(form.password.data)
 
             return super(UserModelView, self).on_model_change(form, model, is_created)
 
@@ -153,7 +193,7 @@ def create_app(testing=False):
 
         def on_model_change(self, form, model, is_created):
             if hasattr(form, 'password') and form.password.data:
-                model.password_hash = hashpw(form.password.data.encode('utf-8'), gensalt()).decode('utf-8')
+                model.password_hash = gerar_hash_senha(form.password.data)
             return super(CompanyModelView, self).on_model_change(form, model, is_created)
     
     class ExamModelView(BaseModelView):
@@ -220,21 +260,130 @@ def create_app(testing=False):
             'expiration': 'Expira em'
         }
     # Adicionando os modelos ao painel administrativo
-    db = get_db(testing=testing)
+    # Sessão escolhida por requisição (leitura nas listagens GET), encerrada no teardown
+    db = SessaoRoteada(testing)
     # Corrija estas linhas removendo .session
     admin.add_view(UserModelView(User, db, name='user', endpoint='user'))
     admin.add_view(CompanyModelView(Company, db, name='company', endpoint='company'))
     admin.add_view(ExamModelView(Exam, db, name='exam', endpoint='exam'))
     admin.add_view(PendingUserModelView(PendingUser, db, name='pending_user', endpoint='pending_user'))
     admin.add_view(PendingCompanyModelView(PendingCompany, db, name='pending_company', endpoint='pending_company'))
-    # Inicializar o banco de dados após a criação do app
-    init_db()
+    # Inicializar o banco de dados após a criação do app (o de testes quando testing)
+    init_db(testing)
+
+    # Índice de autocomplete em memória, com sessão própria para a carga
+    app.config.setdefault('AUTOCOMPLETE_RECARGA', int(os.environ.get('AUTOCOMPLETE_RECARGA', 300)))
+    try:
+        autocomplete.construir(fabrica_sessoes_teste if testing else fabrica_sessoes, app.config['AUTOCOMPLETE_RECARGA'])
+    except Exception as e:
+        app.logger.error(f"Erro ao construir o índice de autocomplete: {str(e)}")
+
+    # Envio da outbox de e-mails em segundo plano: intervalo entre rodadas (s), e-mails por
+    # conexão SMTP, tentativas antes de desistir e base do backoff exponencial (s)
+    app.config.setdefault('OUTBOX_ATIVO', os.environ.get('OUTBOX_ATIVO', '0' if testing else '1') == '1')
+    app.config.setdefault('OUTBOX_INTERVALO', float(os.environ.get('OUTBOX_INTERVALO', 5)))
+    app.config.setdefault('OUTBOX_LOTE', int(os.environ.get('OUTBOX_LOTE', 50)))
+    app.config.setdefault('OUTBOX_TENTATIVAS', int(os.environ.get('OUTBOX_TENTATIVAS', 8)))
+    app.config.setdefault('OUTBOX_BACKOFF', int(os.environ.get('OUTBOX_BACKOFF', 30)))
+    enviador_emails.configurar(app.config, fabrica_sessoes_teste if testing else fabrica_sessoes,
+                               app.config['OUTBOX_INTERVALO'], app.config['OUTBOX_LOTE'],
+                               app.config['OUTBOX_TENTATIVAS'], app.config['OUTBOX_BACKOFF'])
+    if app.config['OUTBOX_ATIVO']:
+        enviador_emails.iniciar()
+
+    # Manutenção periódica em segundo plano (intervalos em segundos; 0 desativa a tarefa)
+    app.config.setdefault('AGENDADOR_ATIVO', os.environ.get('AGENDADOR_ATIVO', '0' if testing else '1') == '1')
+    app.config.setdefault('LIMPEZA_PENDENTES_INTERVALO', int(os.environ.get('LIMPEZA_PENDENTES_INTERVALO', 600)))
+    app.config.setdefault('LIMPEZA_TOKENS_INTERVALO', int(os.environ.get('LIMPEZA_TOKENS_INTERVALO', 3600)))
+    app.config.setdefault('LIMPEZA_LOTE', int(os.environ.get('LIMPEZA_LOTE', 500)))
+    lote_limpeza = app.config['LIMPEZA_LOTE']
+    agendador.configurar(fabrica_sessoes_teste if testing else fabrica_sessoes)
+    agendador.registrar('pendentes', app.config['LIMPEZA_PENDENTES_INTERVALO'], lambda session: {
+        modelo.__tablename__: remover_pendentes_expirados(session, modelo, lote_limpeza) for modelo in TIPOS_PENDENTES
+    })
+    agendador.registrar('refresh_tokens', app.config['LIMPEZA_TOKENS_INTERVALO'],
+                        lambda session: remover_refresh_expirados(session, lote_limpeza))
+    agendador.registrar('limites', app.config['LIMPEZA_TOKENS_INTERVALO'], lambda session: limitador.limpar())
+
+    # Perfil do SQLite (pragmas vindos de SQLITE_* no ambiente), conferido e registrado na
+    # inicialização, e manutenção periódica: checkpoint do WAL e PRAGMA optimize (ANALYZE)
+    banco = test_engine if testing else engine
+    if banco.dialect.name == 'sqlite':
+        app.config['SQLITE_PERFIL'] = ler_pragmas(banco)
+        app.logger.info(f"Perfil SQLite de {banco.url.database}: {app.config['SQLITE_PERFIL']}")
+        app.config.setdefault('SQLITE_CHECKPOINT_INTERVALO', int(os.environ.get('SQLITE_CHECKPOINT_INTERVALO', 300)))
+        app.config.setdefault('SQLITE_OTIMIZAR_INTERVALO', int(os.environ.get('SQLITE_OTIMIZAR_INTERVALO', 3600)))
+        agendador.registrar('sqlite_checkpoint', app.config['SQLITE_CHECKPOINT_INTERVALO'], checkpoint_wal)
+        agendador.registrar('sqlite_otimizar', app.config['SQLITE_OTIMIZAR_INTERVALO'], otimizar_sqlite)
+    if app.config['AGENDADOR_ATIVO']:
+        agendador.iniciar()
+
+    # Sessões por requisição: encerradas no teardown, para que a próxima requisição da thread
+    # não herde transação, snapshot antigo (que segura o WAL do SQLite) nem mapa de identidades
+    app.teardown_appcontext(encerrar_sessoes)
+
+    @app.cli.command('reconstruir-estatisticas')
+    def reconstruir_estatisticas():
+        """Recalcula as tabelas de agregação de exames"""
+        lidos = reconstruir_agregados(get_db(testing=testing))
+        print(f"Estatísticas reconstruídas a partir de {lidos} exames.")
+
+    @app.cli.command('migrar-ids')
+    def migrar_ids():
+        """Converte para 16 bytes os ULIDs em texto de um banco SQLite antigo"""
+        convertidos = migrar_ids_binarios(test_engine if testing else engine, Base.metadata)
+        if not convertidos:
+            print("Nada a converter: o banco já usa ids binários.")
+        for coluna, total in convertidos.items():
+            print(f"{coluna}: {total} ids convertidos")
+
+    @app.cli.command('reconstruir-busca')
+    def reconstruir_busca():
+        """Reindexa a pesquisa textual de exames (necessário após VACUUM)"""
+        reconstruir_indice_busca(get_db(testing=testing))
+        print("Índice de pesquisa reconstruído.")
+
+    @app.cli.command('limpar-tokens')
+    def limpar_tokens():
+        """Remove os refresh tokens vencidos"""
+        removidos = agendador.executar('refresh_tokens')
+        print(f"{removidos} refresh tokens vencidos removidos.")
+
+    @app.cli.command('limpar-pendentes')
+    def limpar_pendentes():
+        """Remove os cadastros pendentes expirados"""
+        for tabela, removidos in agendador.executar('pendentes').items():
+            print(f"{tabela}: {removidos} registros expirados removidos.")
+
+    @app.cli.command('enviar-emails')
+    def enviar_emails():
+        """Envia agora os e-mails vencidos da outbox"""
+        total = 0
+        while True:
+            reservados = enviador_emails.processar()
+            total += reservados
+            if reservados < enviador_emails.lote:
+                break
+        print(f"{total} e-mails processados ({enviador_emails.enviados} enviados, {enviador_emails.falhas} falhas).")
+
+    @app.cli.command('calibrar-senhas')
+    @click.option('--alvo-ms', default=250, show_default=True, help='Tempo desejado por hash, em milissegundos')
+    def calibrar_senhas(alvo_ms):
+        """Mede o bcrypt nesta máquina e recomenda o SENHAS_CUSTO para o tempo alvo"""
+        recomendado, medicoes = calibrar_custo(alvo_ms)
+        for custo, tempo in medicoes.items():
+            print(f"custo {custo:2d}: {tempo:8.1f} ms")
+        vazao = servico_senhas.trabalhadores * 1000 / medicoes[recomendado]
+        print(f"Custo recomendado: {recomendado} (configurado: {servico_senhas.custo}); "
+              f"capacidade estimada de {vazao:.0f} logins/s com {servico_senhas.trabalhadores} threads.")
 
     # Registrar blueprints com nomes únicos
     from app.routes.user_routes import user_bp
     from app.routes.company_routes import company_bp
     from app.routes.exam_routes import exam_bp
     from app.routes.image_routes import image_bp
+    from app.routes.metrics_routes import metrics_bp
+    from app.routes.autocomplete_routes import autocomplete_bp
   
     from app.routes.login import auth_bp
     app.register_blueprint(auth_bp, url_prefix='/api', name='auth')
@@ -242,28 +391,14 @@ def create_app(testing=False):
     app.register_blueprint(company_bp, url_prefix='/api', name='company_blueprint')
     app.register_blueprint(exam_bp, url_prefix='/api', name='exam_blueprint')
     app.register_blueprint(image_bp, url_prefix='/api')
+    app.register_blueprint(metrics_bp, url_prefix='/api')
+    app.register_blueprint(autocomplete_bp, url_prefix='/api')
 
     return app
 
-def get_db(testing=False):
-    if testing:
-        return TestSession()
-    return Session()
-
 def init_db(testing=False):
-    
-    
-    
     """Inicializa o banco de dados criando todas as tabelas"""
-    from app.models.user import Base
-    from app.models.company import Base
-    from app.models.exam import Base
-    
-    
-    if testing:
-        Base.metadata.create_all(bind=test_engine)
-        return
-    Base.metadata.create_all(bind=engine)
+    inicializar_banco(test_engine if testing else engine)
 def drop_test_db():
     
     from app.models.user import Base
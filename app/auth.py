@@ -0,0 +1,102 @@
+# app/auth.py
+import time
+from datetime import datetime, timezone, timedelta
+from functools import wraps
+import jwt
+from flask import request, jsonify, current_app, g
+from app.cache import CacheEntidades, CACHES_POR_ENTIDADE
+from app.database import get_db
+from app.models.user import User
+from app.models.company import Company
+from app.models.identity import IdentityKind
+
+# Validade dos tokens de acesso emitidos pelo login
+VALIDADE_TOKEN = timedelta(hours=1)
+
+# Modelo e colunas carregadas para cada tipo de conta
+PRINCIPAIS = {
+    IdentityKind.USUARIO: (User, ('id', 'name', 'email', 'role')),
+    IdentityKind.EMPRESA: (Company, ('id', 'name', 'email')),
+}
+
+# Tokens já verificados (token -> claims) e contas carregadas ((tipo, id) -> dict).
+# As contas são invalidadas pelos mesmos eventos de sessão do cache de obter.
+cache_tokens = CacheEntidades(capacidade=4096, ttl=int(VALIDADE_TOKEN.total_seconds()))
+cache_principais = CacheEntidades(capacidade=4096, ttl=300)
+CACHES_POR_ENTIDADE.append(cache_principais)
+
+
+class TokenInvalido(Exception):
+    """Token ausente, expirado, com assinatura inválida ou de conta inexistente"""
+    pass
+
+
+def emitir_token_acesso(conta_id, tipo):
+    """JWT HS256 com o id da conta em 'sub' e o tipo ('usuario' ou 'empresa') em 'tipo'"""
+    payload = {'sub': conta_id, 'tipo': tipo, 'exp': datetime.now(timezone.utc) + VALIDADE_TOKEN}
+    return jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm='HS256')
+
+
+def verificar_token(token):
+    """Claims do token, da memória enquanto não expira ou verificando a assinatura"""
+    claims = cache_tokens.obter(token)
+    if claims is not None and claims['exp'] > time.time():
+        return claims
+    try:
+        claims = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'],
+                            options={'require': ['sub', 'exp']})
+    except jwt.PyJWTError as e:
+        raise TokenInvalido(str(e))
+    cache_tokens.guardar(token, claims)
+    return claims
+
+
+def _carregar_conta(db, tipo, conta_id):
+    modelo, campos = PRINCIPAIS[tipo]
+    linha = db.query(*[getattr(modelo, campo) for campo in campos]).filter(modelo.id == conta_id).first()
+    if linha is None:
+        return None
+    principal = dict(zip(campos, linha))
+    principal['tipo'] = tipo
+    return principal
+
+
+def carregar_principal(claims):
+    """Conta do token como dict, com uma consulta por chave primária em caso de miss"""
+    tipo = claims.get('tipo')
+    # Tokens anteriores ao claim 'tipo' ainda são aceitos até expirarem
+    tipos = [tipo] if tipo in PRINCIPAIS else list(PRINCIPAIS)
+    for tipo in tipos:
+        chave = (tipo, claims['sub'])
+        principal = cache_principais.obter(chave)
+        if principal is None:
+            # Vai para o cache: lido da principal, nunca de uma réplica atrasada
+            principal = _carregar_conta(get_db(leitura=False), tipo, claims['sub'])
+            if principal is not None:
+                cache_principais.guardar(chave, principal)
+        if principal is not None:
+            return principal
+    raise TokenInvalido("Conta do token não encontrada")
+
+
+def autenticado(*tipos):
+    """
+    Exige 'Authorization: Bearer <token>' válido e disponibiliza a conta em
+    g.principal. Com tipos informados (IdentityKind.USUARIO/EMPRESA), contas
+    de outro tipo recebem 403.
+    """
+    def decorador(funcao):
+        @wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            esquema, _, token = request.headers.get('Authorization', '').partition(' ')
+            if esquema.lower() != 'bearer' or not token:
+                return jsonify({"erro": "Token de acesso não fornecido"}), 401
+            try:
+                g.principal = carregar_principal(verificar_token(token.strip()))
+            except TokenInvalido:
+                return jsonify({"erro": "Token de acesso inválido ou expirado"}), 401
+            if tipos and g.principal['tipo'] not in tipos:
+                return jsonify({"erro": "Acesso não permitido para este tipo de conta"}), 403
+            return funcao(*args, **kwargs)
+        return envoltorio
+    return decorador
@@ -0,0 +1,204 @@
+# app/autocomplete.py
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from app.models.user import User
+from app.models.company import Company
+from app.name_search import normalizar_nome
+
+# Tipo exposto na resposta para cada modelo indexado
+TIPOS = {User: 'usuario', Company: 'empresa'}
+
+
+class IndicePrefixos:
+    """
+    Vetor ordenado de (chave, id) com busca por bisect. Cada nome entra uma
+    vez por palavra ("maria jose souza", "jose souza", "souza"), de modo que
+    o prefixo casa com o início de qualquer palavra.
+    """
+
+    def __init__(self):
+        self._chaves = []
+        self._nomes = {}
+
+    def __len__(self):
+        return len(self._nomes)
+
+    @staticmethod
+    def _chaves_do_nome(nome):
+        palavras = (normalizar_nome(nome) or '').split()
+        return {' '.join(palavras[i:]) for i in range(len(palavras))}
+
+    def adicionar(self, id, nome):
+        self.remover(id)
+        self._nomes[id] = nome
+        for chave in self._chaves_do_nome(nome):
+            insort(self._chaves, (chave, id))
+
+    def remover(self, id):
+        nome = self._nomes.pop(id, None)
+        if nome is None:
+            return
+        for chave in self._chaves_do_nome(nome):
+            posicao = bisect_left(self._chaves, (chave, id))
+            if posicao < len(self._chaves) and self._chaves[posicao] == (chave, id):
+                del self._chaves[posicao]
+
+    def carregar(self, pares):
+        """Substitui o conteúdo a partir de (id, nome), ordenando uma única vez"""
+        nomes = dict(pares)
+        chaves = [(chave, id) for id, nome in nomes.items() for chave in self._chaves_do_nome(nome)]
+        chaves.sort()
+        self._chaves, self._nomes = chaves, nomes
+
+    def buscar(self, prefixo):
+        """Gera (chave, id, nome) em ordem alfabética para as chaves com o prefixo"""
+        posicao = bisect_left(self._chaves, (prefixo,))
+        while posicao < len(self._chaves):
+            chave, id = self._chaves[posicao]
+            if not chave.startswith(prefixo):
+                return
+            yield chave, id, self._nomes[id]
+            posicao += 1
+
+
+class Autocomplete:
+    """
+    Índices de prefixos de usuários e empresas do worker. Construído na
+    inicialização, atualizado pelos commits do próprio processo e recarregado
+    em segundo plano a cada `recarga` segundos para refletir os demais workers
+    (AUTOCOMPLETE_RECARGA=0 desliga a recarga).
+
+    Memória: uma entrada por palavra de cada nome, cerca de 450 bytes por nome
+    de três palavras (uns 45 MB a cada 100 mil nomes, em cada worker), com o
+    índice antigo e o novo coexistindo durante a troca.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indices = {tipo: IndicePrefixos() for tipo in TIPOS.values()}
+        self._carregar_sessao = None
+        self.recarga = 300
+        self._carregado_em = 0
+        self._recarregando = False
+        # Alterações do próprio processo durante uma recarga, reaplicadas após a troca
+        self._pendentes = None
+
+    def construir(self, criar_sessao, recarga=300):
+        self._carregar_sessao = criar_sessao
+        self.recarga = recarga
+        self._recarregar()
+
+    def _recarregar(self):
+        with self._lock:
+            self._pendentes = []
+        try:
+            session = self._carregar_sessao()
+            try:
+                # A marca d'água (maior id: os ULIDs são crescentes) e a carga saem da
+                # mesma transação; o que foi inserido depois vem na consulta seguinte.
+                # Alterações de outros workers nesse intervalo ficam para a próxima recarga
+                marcas = {tipo: session.query(func.max(modelo.id)).scalar() for modelo, tipo in TIPOS.items()}
+                dados = {tipo: session.query(modelo.id, modelo.name).all() for modelo, tipo in TIPOS.items()}
+                session.commit()
+                novos = []
+                for modelo, tipo in TIPOS.items():
+                    query = session.query(modelo.id, modelo.name)
+                    if marcas[tipo] is not None:
+                        query = query.filter(modelo.id > marcas[tipo])
+                    novos.extend((tipo, id, nome) for id, nome in query)
+            finally:
+                session.close()
+            with self._lock:
+                for tipo, pares in dados.items():
+                    self._indices[tipo].carregar(pares)
+                # Inserções de outros workers durante a carga e, por cima, as
+                # alterações do próprio processo, que podem ser mais recentes
+                self._aplicar(novos)
+                self._aplicar(self._pendentes)
+        finally:
+            # Mesmo em caso de erro, espera o próximo intervalo para tentar de novo
+            with self._lock:
+                self._pendentes = None
+                self._carregado_em = time.monotonic()
+                self._recarregando = False
+
+    def _recarregar_se_antigo(self):
+        if not self._carregar_sessao or not self.recarga:
+            return
+        with self._lock:
+            if self._recarregando or time.monotonic() - self._carregado_em < self.recarga:
+                return
+            self._recarregando = True
+        threading.Thread(target=self._recarregar, daemon=True).start()
+
+    def aplicar(self, alteracoes):
+        with self._lock:
+            self._aplicar(alteracoes)
+            if self._pendentes is not None:
+                self._pendentes.extend(alteracoes)
+
+    def _aplicar(self, alteracoes):
+        for tipo, id, nome in alteracoes:
+            if nome is None:
+                self._indices[tipo].remover(id)
+            else:
+                self._indices[tipo].adicionar(id, nome)
+
+    def buscar(self, termo, limite, tipo=None):
+        self._recarregar_se_antigo()
+        prefixo = normalizar_nome(termo)
+        if not prefixo:
+            return []
+        tipos = [tipo] if tipo else list(self._indices)
+        resultados = []
+        vistos = set()
+        with self._lock:
+            fontes = [self._marcados(t, prefixo) for t in tipos]
+            for chave, t, id, nome in heapq.merge(*fontes):
+                if (t, id) in vistos:
+                    continue
+                vistos.add((t, id))
+                resultados.append({"id": id, "name": nome, "tipo": t})
+                if len(resultados) >= limite:
+                    break
+        return resultados
+
+    def _marcados(self, tipo, prefixo):
+        for chave, id, nome in self._indices[tipo].buscar(prefixo):
+            yield chave, tipo, id, nome
+
+    def tamanho(self):
+        with self._lock:
+            return {tipo: len(indice) for tipo, indice in self._indices.items()}
+
+
+autocomplete = Autocomplete()
+
+
+@event.listens_for(Session, 'after_flush')
+def registrar_alteracoes(session, flush_context):
+    alteracoes = session.info.setdefault('autocomplete', [])
+    for objeto in list(session.new) + list(session.dirty):
+        tipo = TIPOS.get(type(objeto))
+        if tipo:
+            alteracoes.append((tipo, objeto.id, objeto.name))
+    for objeto in session.deleted:
+        tipo = TIPOS.get(type(objeto))
+        if tipo:
+            alteracoes.append((tipo, objeto.id, None))
+
+
+@event.listens_for(Session, 'after_commit')
+def aplicar_alteracoes(session):
+    alteracoes = session.info.pop('autocomplete', None)
+    if alteracoes:
+        autocomplete.aplicar(alteracoes)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def descartar_alteracoes(session, previous_transaction):
+    session.info.pop('autocomplete', None)
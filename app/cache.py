@@ -0,0 +1,131 @@
+# app/cache.py
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.ids import id_canonico
+
+
+class CacheEntidades:
+    """
+    Cache LRU com TTL das respostas serializadas de obter (usuário, empresa,
+    exame), chaveado por (tipo, id canônico: ver id_canonico). Cada worker do passenger tem o seu; as
+    alterações feitas no próprio processo invalidam a entrada via eventos da
+    sessão e o TTL limita o tempo de uma entrada alterada por outro processo.
+    """
+
+    def __init__(self, capacidade=1024, ttl=60):
+        self._lock = threading.Lock()
+        self.configurar(capacidade, ttl)
+
+    def configurar(self, capacidade, ttl):
+        with self._lock:
+            self.capacidade = capacidade
+            self.ttl = ttl
+            self._entradas = OrderedDict()
+            self.hits = 0
+            self.misses = 0
+            self.invalidacoes = 0
+
+    def obter(self, chave):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None and entrada[0] > time.monotonic():
+                self._entradas.move_to_end(chave)
+                self.hits += 1
+                return entrada[1]
+            if entrada is not None:
+                del self._entradas[chave]
+            self.misses += 1
+            return None
+
+    def guardar(self, chave, valor):
+        if self.capacidade <= 0:
+            return
+        with self._lock:
+            self._entradas[chave] = (time.monotonic() + self.ttl, valor)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.capacidade:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self, chave):
+        with self._lock:
+            if self._entradas.pop(chave, None) is not None:
+                self.invalidacoes += 1
+
+    def obter_ou_carregar(self, chave, carregar):
+        """
+        Retorna (corpo, etag, last_modified) do cache ou de carregar(), que
+        devolve (dict, etag, last_modified) ou None quando a entidade não existe
+        """
+        valor = self.obter(chave)
+        if valor is not None:
+            return valor
+        carregado = carregar()
+        if carregado is None:
+            return None
+        dados, etag, last_modified = carregado
+        valor = (current_app.json.dumps(dados).encode('utf-8'), etag, last_modified)
+        self.guardar(chave, valor)
+        return valor
+
+    def estatisticas(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entradas": len(self._entradas),
+                "capacidade": self.capacidade,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidacoes": self.invalidacoes,
+                "taxa_acerto": round(self.hits / total, 4) if total else None
+            }
+
+
+cache_entidades = CacheEntidades()
+
+# Caches chaveados por (tipo, id) invalidados pelos eventos da sessão abaixo
+CACHES_POR_ENTIDADE = [cache_entidades]
+
+# Tipo usado na chave do cache para cada tabela em cache
+TIPOS_EM_CACHE = {
+    'users': 'usuario',
+    'companies': 'empresa',
+    'exams': 'exame',
+}
+
+
+def _invalidar(chave):
+    for cache in CACHES_POR_ENTIDADE:
+        cache.invalidar(chave)
+
+
+def _chaves_alteradas(session):
+    for objeto in list(session.dirty) + list(session.deleted):
+        tipo = TIPOS_EM_CACHE.get(getattr(objeto, '__tablename__', None))
+        if tipo and objeto.id:
+            yield (tipo, id_canonico(objeto.id))
+
+
+@event.listens_for(Session, 'after_flush')
+def invalidar_apos_flush(session, flush_context):
+    # Invalida já no flush e guarda as chaves para repetir no commit, quando
+    # outra requisição pode ter recolocado no cache a versão anterior
+    chaves = session.info.setdefault('cache_invalidar', set())
+    for chave in _chaves_alteradas(session):
+        chaves.add(chave)
+        _invalidar(chave)
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidar_apos_commit(session):
+    for chave in session.info.pop('cache_invalidar', ()):
+        _invalidar(chave)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def descartar_apos_rollback(session, previous_transaction):
+    session.info.pop('cache_invalidar', None)
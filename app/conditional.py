@@ -0,0 +1,57 @@
+# app/conditional.py
+import hashlib
+from datetime import timezone
+from flask import request, jsonify, current_app
+
+
+def calcular_etag(*partes):
+    """
+    ETag forte a partir das linhas projetadas (que incluem updated_at).
+    Usa os valores e não só o updated_at, que no SQLite tem resolução de
+    segundos e não distinguiria duas alterações no mesmo segundo.
+    """
+    return hashlib.sha1(repr(partes).encode('utf-8')).hexdigest()
+
+
+def ultima_modificacao(valores):
+    """Maior updated_at (UTC, sem microssegundos) para o cabeçalho Last-Modified"""
+    datas = [valor for valor in valores if valor is not None]
+    if not datas:
+        return None
+    return max(datas).replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def nao_modificado(etag, last_modified):
+    """Avalia If-None-Match (prioritário) e If-Modified-Since"""
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified and request.if_modified_since:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def resposta_condicional(montar_corpo, etag, last_modified=None):
+    """Retorna 304 sem serializar quando o cliente já tem a versão atual"""
+    if nao_modificado(etag, last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(montar_corpo())
+    return _com_validadores(response, etag, last_modified)
+
+
+def resposta_serializada(corpo, etag, last_modified=None):
+    """Como resposta_condicional, para um corpo JSON já serializado (cache)"""
+    if nao_modificado(etag, last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(corpo, mimetype=current_app.json.mimetype)
+    return _com_validadores(response, etag, last_modified)
+
+
+def _com_validadores(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    return response
@@ -0,0 +1,132 @@
+# app/db_monitor.py
+import logging
+import threading
+import time
+import weakref
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMedido(QueuePool):
+    """QueuePool que mede quanto cada checkout esperou por uma conexão"""
+
+    medidor = None
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            if self.medidor is not None:
+                self.medidor.registrar(time.perf_counter() - inicio)
+
+    def recreate(self):
+        # dispose() troca o pool por outro da mesma classe: as medições continuam
+        novo = super().recreate()
+        novo.medidor = self.medidor
+        return novo
+
+
+class MedidorPool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+        self.pico_em_uso = 0
+
+    def registrar(self, segundos):
+        with self._lock:
+            self.checkouts += 1
+            self.espera_total += segundos
+            self.espera_maxima = max(self.espera_maxima, segundos)
+
+
+class MonitorBanco:
+    """
+    Métricas das engines da aplicação: espera no checkout do pool, conexões
+    em uso e sessões que continuam com transação aberta depois do fim da
+    requisição que as abriu (vazamentos, contados e registrados no log).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engines = {}
+        self._medidores = {}
+        self._abertas = {}
+        self.vazamentos = 0
+
+    def instrumentar(self, engine, nome):
+        if not self._engines:
+            event.listen(Session, 'after_begin', self._sessao_iniciada)
+            event.listen(Session, 'after_transaction_end', self._transacao_encerrada)
+        medidor = self._medidores.setdefault(nome, MedidorPool())
+        self._engines[engine] = nome
+        if isinstance(engine.pool, PoolMedido):
+            engine.pool.medidor = medidor
+
+        @event.listens_for(engine, 'checkout')
+        def _checkout(conexao, registro, proxy):
+            medidor.pico_em_uso = max(medidor.pico_em_uso, engine.pool.checkedout())
+
+    def _sessao_iniciada(self, session, transaction, connection):
+        if connection.engine not in self._engines or id(session) in self._abertas:
+            return
+        origem = request.path if has_request_context() else threading.current_thread().name
+        with self._lock:
+            self._abertas[id(session)] = (weakref.ref(session), time.monotonic(), origem)
+        if has_request_context():
+            g.setdefault('sessoes_abertas', []).append(id(session))
+
+    def _transacao_encerrada(self, session, transaction):
+        if transaction.parent is None:
+            with self._lock:
+                self._abertas.pop(id(session), None)
+
+    def verificar_requisicao(self):
+        """Chamado no teardown: conta as sessões da requisição que ficaram abertas"""
+        vazadas = 0
+        for chave in g.pop('sessoes_abertas', []):
+            aberta = self._abertas.get(chave)
+            if aberta is not None and aberta[0]() is not None:
+                vazadas += 1
+                logger.warning(f"Sessão do banco aberta após o fim da requisição {aberta[2]}")
+        with self._lock:
+            self.vazamentos += vazadas
+        return vazadas
+
+    def _sessoes_abertas(self):
+        with self._lock:
+            # Sessões coletadas pelo GC já devolveram a conexão
+            for chave in [chave for chave, aberta in self._abertas.items() if aberta[0]() is None]:
+                del self._abertas[chave]
+            return list(self._abertas.values())
+
+    def estatisticas(self):
+        abertas = self._sessoes_abertas()
+        agora = time.monotonic()
+        pools = {}
+        for engine, nome in self._engines.items():
+            medidor = self._medidores[nome]
+            pool = engine.pool
+            pools[nome] = {
+                "tamanho": pool.size() if isinstance(pool, QueuePool) else None,
+                "em_uso": pool.checkedout() if isinstance(pool, QueuePool) else None,
+                "pico_em_uso": medidor.pico_em_uso,
+                "checkouts": medidor.checkouts,
+                "espera_media_ms": round(medidor.espera_total / medidor.checkouts * 1000, 3) if medidor.checkouts else 0.0,
+                "espera_maxima_ms": round(medidor.espera_maxima * 1000, 3)
+            }
+        return {
+            "pools": pools,
+            "sessoes_abertas": len(abertas),
+            "sessao_mais_antiga_s": round(max((agora - inicio for _, inicio, _ in abertas), default=0.0), 3),
+            "vazamentos": self.vazamentos
+        }
+
+
+monitor_banco = MonitorBanco()
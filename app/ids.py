@@ -0,0 +1,155 @@
+# app/ids.py
+import logging
+import os
+import threading
+import time
+from sqlalchemy import LargeBinary, text
+from sqlalchemy.types import TypeDecorator
+from ulid import base32
+
+logger = logging.getLogger(__name__)
+
+# Versão do banco (PRAGMA user_version) a partir da qual os ids já são binários
+VERSAO_IDS_BINARIOS = 1
+
+
+class GeradorULID:
+    """
+    Gera ULIDs monotônicos: dentro do mesmo milissegundo (ou com o relógio
+    voltando) a parte aleatória do anterior é incrementada, então cada id é
+    maior que o anterior e os inserts entram no fim do índice da chave.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ultimo_ms = 0
+        self._aleatorio = 0
+
+    def reiniciar(self):
+        # Workers criados por fork não podem continuar a sequência do processo pai
+        self._lock = threading.Lock()
+        self._ultimo_ms = 0
+
+    def novo_binario(self):
+        with self._lock:
+            agora = time.time_ns() // 1_000_000
+            if agora > self._ultimo_ms:
+                self._ultimo_ms = agora
+                self._aleatorio = int.from_bytes(os.urandom(10), 'big')
+            else:
+                self._aleatorio += 1
+                if self._aleatorio >> 80:
+                    # Parte aleatória esgotada no milissegundo: segue no próximo
+                    self._ultimo_ms += 1
+                    self._aleatorio = int.from_bytes(os.urandom(10), 'big')
+            return self._ultimo_ms.to_bytes(6, 'big') + self._aleatorio.to_bytes(10, 'big')
+
+    def novo(self):
+        return base32.encode(self.novo_binario())
+
+
+gerador_ulid = GeradorULID()
+os.register_at_fork(after_in_child=gerador_ulid.reiniciar)
+
+
+def novo_ulid():
+    """Novo ULID monotônico na forma texto (26 caracteres), default das chaves"""
+    return gerador_ulid.novo()
+
+
+def ulid_binario(valor):
+    """Os 16 bytes do ULID em texto; ValueError se o texto não for um ULID"""
+    if len(valor) != 26:
+        raise ValueError(f"ULID deve ter 26 caracteres: {valor!r}")
+    return base32.decode(valor)
+
+
+def id_canonico(valor):
+    """
+    O ULID na forma em que o banco o devolve (maiúsculas, base32 de
+    Crockford); outros ids voltam como estão. Chave dos caches por id.
+    """
+    try:
+        return base32.encode(ulid_binario(valor))
+    except ValueError:
+        return valor
+
+
+class _BlobSQLite(LargeBinary):
+    """BLOB sem conversões: o sqlite3 grava bytes como BLOB e str como TEXT"""
+
+    def bind_processor(self, dialect):
+        return None
+
+    def result_processor(self, dialect, coltype):
+        return None
+
+
+class ULIDBinario(TypeDecorator):
+    """
+    ULID gravado em 16 bytes (BLOB no SQLite, bytea no PostgreSQL): metade do
+    texto e com a mesma ordenação. Para a aplicação e a API continua sendo a
+    string de 26 caracteres. Ids antigos que não são ULID continuam texto no
+    SQLite (no PostgreSQL, os bytes do texto).
+    """
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'sqlite':
+            return _BlobSQLite(16)
+        return dialect.type_descriptor(LargeBinary(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, bytes):
+            return value
+        value = str(value)
+        try:
+            return ulid_binario(value)
+        except ValueError:
+            return value if dialect.name == 'sqlite' else value.encode()
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, str):
+            return value
+        value = bytes(value)
+        return base32.encode(value) if len(value) == 16 else value.decode()
+
+
+def _converter_texto(valor):
+    try:
+        return ulid_binario(valor)
+    except ValueError:
+        return valor
+
+
+def migrar_ids_binarios(bind, metadata):
+    """
+    Converte para 16 bytes os ULIDs gravados como texto em todas as colunas
+    ULIDBinario de bancos SQLite antigos (uma vez: PRAGMA user_version marca
+    o banco como migrado). Roda em init_db, que registra no log cada coluna
+    convertida, ou antes do deploy com `flask migrar-ids`. A afinidade TEXT
+    das colunas VARCHAR(26) não altera valores BLOB, então não é preciso
+    recriar as tabelas; os ids que não são ULID ficam como estão. Bancos
+    PostgreSQL são criados já com bytea. Retorna o número de valores
+    convertidos por coluna.
+    """
+    if bind.dialect.name != 'sqlite':
+        return {}
+    convertidos = {}
+    with bind.begin() as conn:
+        if conn.exec_driver_sql('PRAGMA user_version').scalar() >= VERSAO_IDS_BINARIOS:
+            return convertidos
+        conn.connection.driver_connection.create_function('ulid_binario', 1, _converter_texto, deterministic=True)
+        for tabela in metadata.sorted_tables:
+            for coluna in tabela.columns:
+                if isinstance(coluna.type, ULIDBinario):
+                    convertidos[f'{tabela.name}.{coluna.name}'] = conn.execute(text(
+                        f"UPDATE {tabela.name} SET {coluna.name} = ulid_binario({coluna.name}) "
+                        f"WHERE typeof({coluna.name}) = 'text' AND typeof(ulid_binario({coluna.name})) = 'blob'"
+                    )).rowcount
+        conn.exec_driver_sql(f'PRAGMA user_version = {VERSAO_IDS_BINARIOS}')
+    for coluna, total in convertidos.items():
+        if total:
+            logger.warning(f"Migração de ids binários em {bind.url.database}: {total} valores convertidos em {coluna}")
+    return convertidos
@@ -0,0 +1,180 @@
+# app/mailer.py
+import smtplib
+import threading
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+from app.models.outbox import OutboxEmail, OutboxStatus
+
+# Limite do intervalo entre tentativas de um mesmo e-mail
+BACKOFF_MAXIMO = timedelta(hours=1)
+
+
+class EnviadorEmails:
+    """
+    Envia a outbox em segundo plano. Cada rodada reserva um lote de e-mails
+    vencidos (adiando next_attempt_at, o que impede outro worker de pegá-los)
+    e envia todos pela mesma conexão SMTP, mantida aberta enquanto houver
+    fila. Falhas voltam para a fila com backoff exponencial.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._thread = None
+        self._smtp = None
+        self._criar_sessao = None
+        self.enviados = 0
+        self.falhas = 0
+        self.conexoes = 0
+
+    def configurar(self, config, criar_sessao, intervalo=5, lote=50, tentativas=8, backoff=30, reserva=300):
+        self.config = config
+        self._criar_sessao = criar_sessao
+        self.intervalo = intervalo
+        self.lote = lote
+        self.tentativas = tentativas
+        self.backoff = timedelta(seconds=backoff)
+        self.reserva = timedelta(seconds=reserva)
+
+    def iniciar(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._executar, name='outbox', daemon=True)
+            self._thread.start()
+
+    def acordar(self):
+        self._acordar.set()
+
+    def _executar(self):
+        while True:
+            self._acordar.wait(self.intervalo)
+            self._acordar.clear()
+            try:
+                while self.processar() == self.lote:
+                    pass
+            except Exception:
+                # Erro de banco: a próxima rodada tenta de novo
+                self._fechar()
+
+    def _conectar(self):
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except smtplib.SMTPException:
+                pass
+            self._fechar()
+        config = self.config
+        classe = smtplib.SMTP_SSL if config.get('MAIL_USE_SSL') else smtplib.SMTP
+        smtp = classe(config['MAIL_SERVER'], config['MAIL_PORT'], timeout=30)
+        if config.get('MAIL_USE_TLS') and not config.get('MAIL_USE_SSL'):
+            smtp.starttls()
+        if config.get('MAIL_USERNAME') and config.get('MAIL_PASSWORD'):
+            smtp.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+        self._smtp = smtp
+        self.conexoes += 1
+        return smtp
+
+    def _fechar(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+    def _mensagem(self, email):
+        mensagem = EmailMessage()
+        mensagem['Subject'] = email.subject
+        mensagem['From'] = self.config.get('MAIL_DEFAULT_SENDER') or self.config['MAIL_USERNAME']
+        mensagem['To'] = email.recipient
+        mensagem.set_content(email.html, subtype='html')
+        return mensagem
+
+    def _reservar(self, session):
+        """Reserva até `lote` e-mails vencidos com um UPDATE condicional por linha"""
+        agora = datetime.utcnow()
+        tabela = OutboxEmail.__table__
+        candidatos = session.execute(
+            select(tabela.c.id, tabela.c.next_attempt_at)
+            .where(tabela.c.status == OutboxStatus.PENDENTE, tabela.c.next_attempt_at <= agora)
+            .order_by(tabela.c.next_attempt_at).limit(self.lote)
+        ).all()
+        reservados = []
+        for id, proxima in candidatos:
+            if session.execute(update(tabela).where(tabela.c.id == id, tabela.c.next_attempt_at == proxima)
+                               .values(next_attempt_at=agora + self.reserva)).rowcount:
+                reservados.append(id)
+        session.commit()
+        return reservados
+
+    def processar(self):
+        """Envia um lote da outbox; retorna quantos e-mails foram reservados"""
+        with self._lock:
+            session = self._criar_sessao()
+            try:
+                reservados = self._reservar(session)
+                if not reservados:
+                    # Fila vazia: a conexão não fica presa ao servidor SMTP
+                    self._fechar()
+                    return 0
+                emails = session.query(OutboxEmail).filter(OutboxEmail.id.in_(reservados)).order_by(OutboxEmail.created_at).all()
+                for email in emails:
+                    try:
+                        self._conectar().send_message(self._mensagem(email))
+                    except (smtplib.SMTPException, OSError) as e:
+                        if not isinstance(e, (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError)):
+                            self._fechar()
+                        self._registrar_falha(email, e)
+                    except Exception as e:
+                        # Linha malformada: falha só deste e-mail, o lote continua
+                        self._registrar_falha(email, e)
+                    else:
+                        email.status = OutboxStatus.ENVIADO
+                        email.sent_at = datetime.utcnow()
+                        email.last_error = None
+                        self.enviados += 1
+                    # Commit por e-mail: um erro adiante não desfaz o registro de quem já saiu
+                    session.commit()
+                return len(reservados)
+            finally:
+                session.close()
+
+    def _registrar_falha(self, email, erro):
+        self.falhas += 1
+        email.attempts += 1
+        email.last_error = str(erro)
+        if email.attempts >= self.tentativas:
+            email.status = OutboxStatus.FALHOU
+        else:
+            email.next_attempt_at = datetime.utcnow() + min(self.backoff * 2 ** (email.attempts - 1), BACKOFF_MAXIMO)
+
+    def estatisticas(self):
+        return {
+            "ativo": self._thread is not None and self._thread.is_alive(),
+            "enviados": self.enviados,
+            "falhas": self.falhas,
+            "conexoes": self.conexoes
+        }
+
+
+enviador_emails = EnviadorEmails()
+
+
+@event.listens_for(Session, 'after_flush')
+def registrar_emails_novos(session, flush_context):
+    if any(isinstance(objeto, OutboxEmail) for objeto in session.new):
+        session.info['outbox_novo'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def acordar_enviador(session):
+    # O e-mail gravado sai na hora, sem esperar o próximo intervalo
+    if session.info.pop('outbox_novo', False):
+        enviador_emails.acordar()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def descartar_emails_novos(session, previous_transaction):
+    session.info.pop('outbox_novo', None)
@@ -1,20 +1,22 @@
 #app/models/company.py
-from bcrypt import checkpw, gensalt, hashpw
+from app.passwords import verificar_senha
 from flask import current_app
 import jwt
 from sqlalchemy import Column, String, DateTime, Text, func
 from sqlalchemy.orm import relationship, declarative_base
 from datetime import datetime, timedelta
 import pytz
-import ulid
 from .exam import Exam
 from app.database import Base
+from app.ids import ULIDBinario, novo_ulid
 timezone = pytz.timezone('UTC')
 
 class Company(Base):
     __tablename__ = 'companies'
-    id = Column(String(26), primary_key=True, default=lambda: str(ulid.new()))
+    id = Column(ULIDBinario, primary_key=True, default=novo_ulid)
     name = Column(String(100), nullable=False)
+    # Nome sem acentos e em minúsculas, mantido por app.name_search
+    name_search = Column(String(100), index=True)
     address = Column(Text, nullable=False)
     phone = Column(String(20), nullable=False)
     cnpj = Column(String(14), unique=True, nullable=False)
@@ -30,7 +32,7 @@ class Company(Base):
         return f"<Company(name='{self.name}', email='{self.email}')>"
 
     def check_password(self, password):
-        return checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        return verificar_senha(password, self.password_hash)
     
     def to_jwt(self):
         payload = {
@@ -42,14 +44,14 @@ class Company(Base):
 
 class PendingCompany(Base):
     __tablename__ = 'pending_companies'
-    id = Column(String, primary_key=True, default=lambda: str(ulid.new()))
+    id = Column(ULIDBinario, primary_key=True, default=novo_ulid)
     name = Column(String, nullable=False)
     address = Column(Text, nullable=False)
     phone = Column(String, nullable=False)
     cnpj = Column(String, unique=True, nullable=False)
     email = Column(String, unique=True, nullable=False)
     password_hash = Column(String, nullable=False)
-    expiration = Column(DateTime, default=lambda: datetime.now(timezone) + timedelta(hours=1))  # Expira em 1 hora
+    expiration = Column(DateTime, default=lambda: datetime.now(timezone) + timedelta(hours=1), index=True)  # Expira em 1 hora
 
 
 
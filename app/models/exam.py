@@ -1,23 +1,32 @@
 #app/models/exam.py
-from sqlalchemy import Column, String, DateTime, func, ForeignKey
+from sqlalchemy import Column, String, DateTime, func, ForeignKey, Index
 from sqlalchemy.orm import relationship, declarative_base
 from datetime import datetime
 import pytz
-import ulid
 from app.database import Base
+from app.ids import ULIDBinario, novo_ulid
 timezone = pytz.timezone('UTC')
 
 class Exam(Base):
     __tablename__ = 'exams'
-    id = Column(String(26), primary_key=True, default=lambda: str(ulid.new()))
+    id = Column(ULIDBinario, primary_key=True, default=novo_ulid)
     title = Column(String(100), nullable=False)
     description = Column(String(500))
-    user_id = Column(String(26), ForeignKey('users.id'))
+    user_id = Column(ULIDBinario, ForeignKey('users.id'))
 
-    company_id = Column(String(26), ForeignKey('companies.id'))
+    company_id = Column(ULIDBinario, ForeignKey('companies.id'))
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
     user = relationship("User", back_populates="exams")
     company = relationship("Company", back_populates="exams")
 
+    __table_args__ = (
+        # Buscas por empresa/usuário em um intervalo de datas
+        Index('ix_exams_company_id_created_at', 'company_id', 'created_at'),
+        Index('ix_exams_user_id_created_at', 'user_id', 'created_at'),
+        # Listagens por empresa/usuário paginadas pelo id (ULID)
+        Index('ix_exams_company_id_id', 'company_id', 'id'),
+        Index('ix_exams_user_id_id', 'user_id', 'id'),
+    )
+
@@ -0,0 +1,110 @@
+#app/models/exam_stats.py
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import Column, String, Integer, event, exists, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+from .exam import Exam
+from app.database import Base
+from app.ids import ULIDBinario
+
+
+class ExamCompanyDaily(Base):
+    """Total de exames por empresa e dia (YYYY-MM-DD)"""
+    __tablename__ = 'exam_company_daily'
+    company_id = Column(ULIDBinario, primary_key=True)
+    day = Column(String(10), primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+
+
+class ExamUserMonthly(Base):
+    """Total de exames por trabalhador e mês (YYYY-MM)"""
+    __tablename__ = 'exam_user_monthly'
+    user_id = Column(ULIDBinario, primary_key=True)
+    month = Column(String(7), primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+
+
+def contabilizar(deltas, company_id, user_id, created_at, sinal):
+    """Acumula +1/-1 nas chaves de agregação de um exame"""
+    if created_at is None:
+        return
+    if company_id:
+        deltas[(ExamCompanyDaily, company_id, created_at.strftime('%Y-%m-%d'))] += sinal
+    if user_id:
+        deltas[(ExamUserMonthly, user_id, created_at.strftime('%Y-%m'))] += sinal
+
+
+def aplicar_deltas(session, deltas):
+    """Soma os deltas nas tabelas de agregação com um upsert por chave"""
+    dialeto = session.get_bind().dialect.name
+    insert = pg_insert if dialeto == 'postgresql' else sqlite_insert
+    for (modelo, entidade, periodo), delta in deltas.items():
+        if not delta:
+            continue
+        tabela = modelo.__table__
+        chaves = [coluna.name for coluna in tabela.primary_key.columns]
+        stmt = insert(tabela).values({chaves[0]: entidade, chaves[1]: periodo, 'total': delta})
+        stmt = stmt.on_conflict_do_update(index_elements=chaves, set_={'total': tabela.c.total + delta})
+        session.execute(stmt)
+
+
+def _valor_anterior(exam, atributo):
+    historico = get_history(exam, atributo)
+    if historico.deleted:
+        return historico.deleted[0]
+    return getattr(exam, atributo)
+
+
+@event.listens_for(Session, 'before_flush')
+def atualizar_agregados(session, flush_context, instances):
+    """Mantém os agregados na mesma transação de qualquer alteração em Exam"""
+    deltas = Counter()
+    for exam in session.new:
+        if isinstance(exam, Exam):
+            if exam.created_at is None:
+                # Mesmo valor que o default do banco (UTC), conhecido antes do INSERT
+                exam.created_at = datetime.utcnow()
+            contabilizar(deltas, exam.company_id, exam.user_id, exam.created_at, 1)
+    for exam in session.dirty:
+        if isinstance(exam, Exam) and session.is_modified(exam):
+            contabilizar(deltas, _valor_anterior(exam, 'company_id'), _valor_anterior(exam, 'user_id'),
+                         _valor_anterior(exam, 'created_at'), -1)
+            contabilizar(deltas, exam.company_id, exam.user_id, exam.created_at, 1)
+    for exam in session.deleted:
+        if isinstance(exam, Exam):
+            contabilizar(deltas, _valor_anterior(exam, 'company_id'), _valor_anterior(exam, 'user_id'),
+                         _valor_anterior(exam, 'created_at'), -1)
+    aplicar_deltas(session, deltas)
+
+
+def reconstruir_agregados(session, lote=5000):
+    """Recalcula os agregados a partir da tabela de exames; retorna o número de exames lidos"""
+    session.query(ExamCompanyDaily).delete()
+    session.query(ExamUserMonthly).delete()
+    deltas = Counter()
+    lidos = 0
+    query = session.query(Exam.company_id, Exam.user_id, Exam.created_at)
+    for company_id, user_id, created_at in query.execution_options(stream_results=True).yield_per(lote):
+        contabilizar(deltas, company_id, user_id, created_at, 1)
+        lidos += 1
+    aplicar_deltas(session, deltas)
+    session.commit()
+    return lidos
+
+
+def popular_agregados(bind):
+    """
+    Preenche os agregados em bancos que já tinham exames antes das tabelas
+    existirem (ambas vazias); depois disso o before_flush os mantém.
+    Retorna o número de exames lidos.
+    """
+    with bind.connect() as conn:
+        vazios = not conn.execute(select(exists(ExamCompanyDaily.__table__.select()))).scalar() \
+            and not conn.execute(select(exists(ExamUserMonthly.__table__.select()))).scalar()
+        if not vazios or not conn.execute(select(exists(Exam.__table__.select()))).scalar():
+            return 0
+    with Session(bind=bind) as session:
+        return reconstruir_agregados(session)
@@ -0,0 +1,121 @@
+#app/models/identity.py
+from sqlalchemy import Column, String, event, select, func
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+from .user import User, PendingUser
+from .company import Company, PendingCompany
+from app.database import Base
+from app.ids import ULIDBinario, novo_ulid
+
+
+class IdentityKind:
+    USUARIO = 'usuario'
+    EMPRESA = 'empresa'
+    USUARIO_PENDENTE = 'usuario_pendente'
+    EMPRESA_PENDENTE = 'empresa_pendente'
+
+    # Tipos que podem se autenticar
+    CONTAS = (USUARIO, EMPRESA)
+
+
+# Tipo registrado para cada modelo com e-mail
+TIPOS_POR_MODELO = {
+    User: IdentityKind.USUARIO,
+    Company: IdentityKind.EMPRESA,
+    PendingUser: IdentityKind.USUARIO_PENDENTE,
+    PendingCompany: IdentityKind.EMPRESA_PENDENTE,
+}
+
+MODELOS_POR_TIPO = {tipo: modelo for modelo, tipo in TIPOS_POR_MODELO.items()}
+
+
+class Identity(Base):
+    """
+    Registro único de e-mails de usuários, empresas e cadastros pendentes.
+    A chave primária no e-mail normalizado faz o banco rejeitar duplicatas
+    entre as quatro tabelas e resolve (tipo, id) com uma busca.
+    """
+    __tablename__ = 'identities'
+    email = Column(String(120), primary_key=True)
+    kind = Column(String(20), nullable=False)
+    entity_id = Column(ULIDBinario, nullable=False)
+
+    def __repr__(self):
+        return f"<Identity(email='{self.email}', kind='{self.kind}')>"
+
+
+def normalizar_email(email):
+    return email.strip().lower() if email else email
+
+
+def _email_anterior(objeto):
+    historico = get_history(objeto, 'email')
+    return historico.deleted[0] if historico.deleted else objeto.email
+
+
+@event.listens_for(Session, 'before_flush')
+def sincronizar_identidades(session, flush_context, instances):
+    """
+    Aplica no registro, antes do flush e na mesma transação, as inclusões,
+    exclusões e trocas de e-mail das entidades. Uma exclusão e uma inclusão
+    do mesmo e-mail (confirmação de cadastro) viram um UPDATE.
+    """
+    remocoes = {}
+    inclusoes = {}
+    for objeto in session.deleted:
+        tipo = TIPOS_POR_MODELO.get(type(objeto))
+        if tipo:
+            remocoes[normalizar_email(_email_anterior(objeto))] = objeto.id
+    for objeto in session.dirty:
+        tipo = TIPOS_POR_MODELO.get(type(objeto))
+        if tipo and get_history(objeto, 'email').has_changes():
+            remocoes[normalizar_email(_email_anterior(objeto))] = objeto.id
+            inclusoes[normalizar_email(objeto.email)] = (tipo, objeto.id)
+    for objeto in session.new:
+        tipo = TIPOS_POR_MODELO.get(type(objeto))
+        if tipo:
+            if not objeto.id:
+                # O mesmo default do modelo, atribuído antes para ir ao registro
+                objeto.id = novo_ulid()
+            inclusoes[normalizar_email(objeto.email)] = (tipo, objeto.id)
+
+    tabela = Identity.__table__
+    for email, entity_id in remocoes.items():
+        if email not in inclusoes:
+            session.execute(tabela.delete().where(tabela.c.email == email, tabela.c.entity_id == entity_id))
+    for email, (tipo, entity_id) in inclusoes.items():
+        if email in remocoes:
+            session.execute(tabela.update().where(tabela.c.email == email,
+                                                  tabela.c.entity_id == remocoes[email])
+                            .values(kind=tipo, entity_id=entity_id))
+        else:
+            session.execute(tabela.insert().values(email=email, kind=tipo, entity_id=entity_id))
+
+
+def popular_identidades(bind):
+    """
+    Preenche o registro em bancos existentes quando está vazio. Contas têm
+    prioridade sobre pendências; e-mails já duplicados ficam com o primeiro.
+    Retorna o número de e-mails registrados.
+    """
+    tabela = Identity.__table__
+    with bind.begin() as conn:
+        if conn.execute(select(func.count()).select_from(tabela)).scalar():
+            return 0
+        registrados = set()
+        for modelo, tipo in TIPOS_POR_MODELO.items():
+            linhas = []
+            for id, email in conn.execute(select(modelo.id, modelo.email)):
+                email = normalizar_email(email)
+                if email and email not in registrados:
+                    registrados.add(email)
+                    linhas.append({'email': email, 'kind': tipo, 'entity_id': id})
+            if linhas:
+                conn.execute(tabela.insert(), linhas)
+        return len(registrados)
+
+
+def resolver_identidade(session, email):
+    """Identity do e-mail ou None, com uma busca pela chave primária"""
+    email = normalizar_email(email)
+    return session.get(Identity, email) if email else None
@@ -0,0 +1,44 @@
+#app/models/outbox.py
+from datetime import datetime
+from sqlalchemy import Column, String, Text, Integer, DateTime, Index
+from app.database import Base
+from app.ids import novo_ulid
+
+
+class OutboxStatus:
+    PENDENTE = 'pendente'
+    ENVIADO = 'enviado'
+    FALHOU = 'falhou'
+
+
+class OutboxEmail(Base):
+    """
+    E-mail a enviar, gravado na mesma transação que o originou. O envio é
+    feito em segundo plano por app.mailer; next_attempt_at controla tanto o
+    backoff entre tentativas quanto a reserva da linha durante o envio.
+    """
+    __tablename__ = 'email_outbox'
+    id = Column(String(26), primary_key=True, default=novo_ulid)
+    recipient = Column(String(120), nullable=False)
+    subject = Column(String(200), nullable=False)
+    html = Column(Text, nullable=False)
+    status = Column(String(10), nullable=False, default=OutboxStatus.PENDENTE)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f"<OutboxEmail(recipient='{self.recipient}', status='{self.status}')>"
+
+
+def enfileirar_email(session, para, assunto, html):
+    """Adiciona o e-mail à outbox da sessão; vai para o banco no commit do chamador"""
+    email = OutboxEmail(recipient=para, subject=assunto, html=html)
+    session.add(email)
+    return email
@@ -0,0 +1,40 @@
+#app/models/pending.py
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete
+from .user import PendingUser
+from .company import PendingCompany
+from .identity import Identity, IdentityKind
+
+# Tipo de cada cadastro pendente no registro de e-mails
+TIPOS_PENDENTES = {
+    PendingUser: IdentityKind.USUARIO_PENDENTE,
+    PendingCompany: IdentityKind.EMPRESA_PENDENTE,
+}
+
+# Tempo após a expiração em que o cadastro ainda é mantido
+CARENCIA_PENDENTES = timedelta(hours=1)
+
+
+def remover_pendentes_expirados(session, modelo, lote=500, carencia=CARENCIA_PENDENTES):
+    """
+    Apaga os cadastros pendentes vencidos há mais de `carencia` com DELETEs
+    de até `lote` linhas pelo índice de expiration, um commit por lote para
+    não segurar a trava de escrita do SQLite. As linhas do registro de
+    e-mails saem no mesmo lote (o DELETE em massa não passa pelos eventos
+    do ORM). Retorna o número de cadastros removidos.
+    """
+    tabela = modelo.__table__
+    identidades = Identity.__table__
+    limite = datetime.utcnow() - carencia
+    removidos = 0
+    while True:
+        # Ordenado para que as duas subconsultas escolham as mesmas linhas
+        ids = (select(tabela.c.id).where(tabela.c.expiration < limite)
+               .order_by(tabela.c.expiration, tabela.c.id).limit(lote))
+        session.execute(delete(identidades).where(identidades.c.kind == TIPOS_PENDENTES[modelo],
+                                                  identidades.c.entity_id.in_(ids)))
+        apagados = session.execute(delete(tabela).where(tabela.c.id.in_(ids))).rowcount
+        session.commit()
+        removidos += apagados
+        if apagados < lote:
+            return removidos
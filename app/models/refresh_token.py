@@ -0,0 +1,110 @@
+#app/models/refresh_token.py
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+from sqlalchemy import Column, String, DateTime, select, update, delete
+from app.database import Base
+from app.ids import ULIDBinario, novo_ulid
+
+# Validade padrão dos refresh tokens
+VALIDADE_REFRESH = timedelta(days=30)
+
+
+class RefreshToken(Base):
+    """
+    Refresh token opaco, guardado apenas como sha256. Cada uso gera o próximo
+    token da mesma família; apresentar um token já usado revoga a família.
+    """
+    __tablename__ = 'refresh_tokens'
+    id = Column(String(26), primary_key=True, default=novo_ulid)
+    token_hash = Column(String(64), unique=True, nullable=False)
+    family_id = Column(String(26), nullable=False, index=True)
+    account_id = Column(ULIDBinario, nullable=False, index=True)
+    kind = Column(String(20), nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    used_at = Column(DateTime, nullable=True)
+    revoked_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class RefreshTokenInvalido(Exception):
+    """Refresh token desconhecido, expirado, revogado ou reutilizado"""
+    pass
+
+
+def _hash(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def emitir_refresh_token(session, account_id, kind, family_id=None, validade=VALIDADE_REFRESH):
+    """Grava um novo token (na família informada ou em uma nova) e retorna o valor em claro"""
+    token = secrets.token_urlsafe(32)
+    session.add(RefreshToken(
+        token_hash=_hash(token),
+        family_id=family_id or novo_ulid(),
+        account_id=account_id,
+        kind=kind,
+        expires_at=datetime.utcnow() + validade
+    ))
+    return token
+
+
+def rotacionar_refresh_token(session, token, validade=VALIDADE_REFRESH):
+    """
+    Consome o token e emite o próximo da família. Retorna (account_id, kind,
+    novo_token); o chamador faz o commit. Um token já consumido indica
+    vazamento: a família inteira é revogada e RefreshTokenInvalido é lançada.
+    """
+    agora = datetime.utcnow()
+    tabela = RefreshToken.__table__
+    linha = session.execute(
+        select(tabela.c.id, tabela.c.family_id, tabela.c.account_id, tabela.c.kind,
+               tabela.c.expires_at, tabela.c.used_at, tabela.c.revoked_at)
+        .where(tabela.c.token_hash == _hash(token))
+    ).first()
+    if linha is None or linha.revoked_at is not None or linha.expires_at <= agora:
+        raise RefreshTokenInvalido()
+
+    # Marca como usado só se ninguém o consumiu antes (duas rotações concorrentes)
+    consumido = session.execute(
+        update(tabela).where(tabela.c.id == linha.id, tabela.c.used_at.is_(None)).values(used_at=agora)
+    ).rowcount
+    if linha.used_at is not None or not consumido:
+        revogar_familia(session, linha.family_id)
+        raise RefreshTokenInvalido()
+
+    novo = emitir_refresh_token(session, linha.account_id, linha.kind, linha.family_id, validade)
+    return linha.account_id, linha.kind, novo
+
+
+def revogar_familia(session, family_id):
+    tabela = RefreshToken.__table__
+    return session.execute(
+        update(tabela).where(tabela.c.family_id == family_id, tabela.c.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    ).rowcount
+
+
+def revogar_tokens_da_conta(session, account_id):
+    """Revoga todas as famílias da conta (troca de senha); o chamador faz o commit"""
+    tabela = RefreshToken.__table__
+    return session.execute(
+        update(tabela).where(tabela.c.account_id == account_id, tabela.c.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    ).rowcount
+
+
+def remover_refresh_expirados(session, lote=1000):
+    """
+    Apaga os tokens vencidos em lotes pelo índice de expires_at, com um commit
+    por lote. Retorna o número de linhas removidas.
+    """
+    tabela = RefreshToken.__table__
+    removidos = 0
+    while True:
+        ids = select(tabela.c.id).where(tabela.c.expires_at < datetime.utcnow()).limit(lote)
+        apagados = session.execute(delete(tabela).where(tabela.c.id.in_(ids))).rowcount
+        session.commit()
+        removidos += apagados
+        if apagados < lote:
+            return removidos
@@ -1,13 +1,13 @@
 # app/models/user.py
 from sqlalchemy import Boolean, Column, String, DateTime, Text, func, Integer
 from sqlalchemy.orm import relationship, declarative_base
-from bcrypt import hashpw, gensalt, checkpw
+from app.passwords import verificar_senha
 from flask import current_app
 import jwt
 from datetime import datetime, timedelta
 import pytz
-import ulid
 from app.database import Base
+from app.ids import ULIDBinario, novo_ulid
 
 # Define o fuso horário padrão
 timezone = pytz.timezone("UTC")
@@ -32,8 +32,10 @@ class UserRole:
 
 class User(Base):
     __tablename__ = "users"
-    id = Column(String(26), primary_key=True, default=lambda: str(ulid.new()))
+    id = Column(ULIDBinario, primary_key=True, default=novo_ulid)
     name = Column(String(50), unique=True, nullable=False)
+    # Nome sem acentos e em minúsculas, mantido por app.name_search
+    name_search = Column(String(50), index=True)
     password_hash = Column(String(128), nullable=False)
     email = Column(String(120), unique=True, nullable=False)
     address = Column(Text, nullable=True)
@@ -50,7 +52,7 @@ class User(Base):
         return f"<User(name='{self.name}', email='{self.email}', cpf='{self.cpf}', role='{UserRole.get_label(self.role)}')>"
 
     def check_password(self, password):
-        return checkpw(password.encode("utf-8"), self.password_hash.encode("utf-8"))
+        return verificar_senha(password, self.password_hash)
 
     def get_role_label(self):
         return UserRole.get_label(self.role)
@@ -70,7 +72,7 @@ class User(Base):
 
 class PendingUser(Base):
     __tablename__ = "pending_users"
-    id = Column(String, primary_key=True, default=lambda: str(ulid.new()))
+    id = Column(ULIDBinario, primary_key=True, default=novo_ulid)
     name = Column(String, nullable=False)
     email = Column(String, unique=True, nullable=False)
     address = Column(Text, nullable=True)
@@ -78,7 +80,7 @@ class PendingUser(Base):
     cpf = Column(String(14), unique=True, nullable=True)
     password_hash = Column(String, nullable=False)
     expiration = Column(
-        DateTime, default=lambda: datetime.now(timezone) + timedelta(hours=1)
+        DateTime, default=lambda: datetime.now(timezone) + timedelta(hours=1), index=True
     )  # Expira em 1 hora
 
     def to_jwt(self):
@@ -0,0 +1,111 @@
+# app/name_search.py
+import unicodedata
+from sqlalchemy import DDL, event, func, inspect, select, text, update
+from app.models.user import User
+from app.models.company import Company
+
+# Termos menores que um trigrama são buscados por prefixo no índice b-tree
+TAMANHO_MINIMO_TRIGRAMA = 3
+
+
+def normalizar_nome(texto):
+    """Remove acentos e diferenças de caixa: 'José' -> 'jose'"""
+    if texto is None:
+        return None
+    decomposto = unicodedata.normalize('NFKD', texto)
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).casefold().strip()
+
+
+def _atualizar_nome_normalizado(mapper, connection, target):
+    target.name_search = normalizar_nome(target.name)
+
+
+for modelo in (User, Company):
+    event.listen(modelo, 'before_insert', _atualizar_nome_normalizado)
+    event.listen(modelo, 'before_update', _atualizar_nome_normalizado)
+
+
+def ddl_indice_nomes(tabela):
+    """
+    Índice FTS5 trigram de conteúdo externo sobre <tabela>.name_search: qualquer
+    substring com 3+ caracteres é resolvida pelo índice em vez de LIKE '%x%'
+    """
+    fts = f'{tabela}_nome_fts'
+    remover_antigo = (f"INSERT INTO {fts}({fts}, rowid, name_search) "
+                      f"SELECT 'delete', old.rowid, old.name_search WHERE old.name_search IS NOT NULL;")
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            name_search, content='{tabela}', content_rowid='rowid', tokenize='trigram'
+        )""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {tabela} BEGIN
+            INSERT INTO {fts}(rowid, name_search) VALUES (new.rowid, new.name_search);
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {tabela} BEGIN
+            {remover_antigo}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF name_search ON {tabela} BEGIN
+            {remover_antigo}
+            INSERT INTO {fts}(rowid, name_search) VALUES (new.rowid, new.name_search);
+        END""",
+    ]
+
+
+for modelo in (User, Company):
+    tabela = modelo.__tablename__
+    for comando in ddl_indice_nomes(tabela):
+        event.listen(modelo.__table__, 'after_create', DDL(comando).execute_if(dialect='sqlite'))
+    event.listen(modelo.__table__, 'before_drop',
+                 DDL(f"DROP TABLE IF EXISTS {tabela}_nome_fts").execute_if(dialect='sqlite'))
+
+
+def migrar_busca_nomes(bind):
+    """
+    Preenche name_search nas linhas antigas e cria o índice trigram em bancos
+    existentes (a coluna é adicionada por adicionar_colunas_ausentes)
+    """
+    with bind.begin() as conn:
+        for modelo in (User, Company):
+            tabela = modelo.__table__
+            pendentes = conn.execute(select(tabela.c.id, tabela.c.name).where(tabela.c.name_search.is_(None))).all()
+            for id, nome in pendentes:
+                conn.execute(update(tabela).where(tabela.c.id == id).values(name_search=normalizar_nome(nome)))
+
+            if bind.dialect.name != 'sqlite':
+                continue
+            fts = f'{modelo.__tablename__}_nome_fts'
+            novo = not inspect(conn).has_table(fts)
+            for comando in ddl_indice_nomes(modelo.__tablename__):
+                conn.execute(text(comando))
+            if novo:
+                conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+def buscar_por_nome(session, modelo, termo, campos, limite):
+    """
+    Linhas cujo nome contém o termo (sem acentos/caixa), ordenadas por
+    relevância: nome idêntico, começa com o termo, posição do termo, tamanho
+    """
+    termo = normalizar_nome(termo)
+    if not termo:
+        return []
+    coluna = modelo.name_search
+    query = session.query(*[getattr(modelo, campo) for campo in campos])
+
+    if len(termo) < TAMANHO_MINIMO_TRIGRAMA:
+        # Intervalo no índice b-tree equivalente a LIKE 'termo%'
+        query = query.filter(coluna >= termo, coluna < termo + '\uffff')
+    elif session.get_bind().dialect.name == 'sqlite':
+        fts = f'{modelo.__tablename__}_nome_fts'
+        consulta = '"' + termo.replace('"', '""') + '"'
+        query = query.filter(text(f"{modelo.__tablename__}.rowid IN "
+                                  f"(SELECT rowid FROM {fts} WHERE {fts} MATCH :consulta)")
+                             ).params(consulta=consulta)
+    else:
+        query = query.filter(coluna.contains(termo, autoescape=True))
+
+    return query.order_by(
+        (coluna == termo).desc(),
+        func.instr(coluna, termo) if session.get_bind().dialect.name == 'sqlite' else func.strpos(coluna, termo),
+        func.length(coluna),
+        modelo.name
+    ).limit(limite).all()
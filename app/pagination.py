@@ -0,0 +1,77 @@
+# app/pagination.py
+from flask import request
+
+# Limites da paginação por cursor (keyset)
+LIMITE_PADRAO = 100
+LIMITE_MAXIMO = 1000
+
+# Limites das buscas por nome (resultados ordenados por relevância)
+LIMITE_BUSCA_PADRAO = 20
+LIMITE_BUSCA_MAXIMO = 100
+
+
+class ParametroInvalido(ValueError):
+    """Erro de validação dos parâmetros de paginação/filtro da query string"""
+    pass
+
+
+def ler_limite(args, padrao, maximo):
+    limite = args.get('limit', padrao)
+    try:
+        limite = int(limite)
+    except (TypeError, ValueError):
+        raise ParametroInvalido("Parâmetro limit deve ser um número inteiro")
+    if limite < 1 or limite > maximo:
+        raise ParametroInvalido(f"Parâmetro limit deve estar entre 1 e {maximo}")
+    return limite
+
+
+def ler_limite_busca(args=None):
+    """Lê e valida o limit das buscas por nome"""
+    args = request.args if args is None else args
+    return ler_limite(args, LIMITE_BUSCA_PADRAO, LIMITE_BUSCA_MAXIMO)
+
+
+def ler_parametros_paginacao(args=None):
+    """Lê e valida limit, after e before da query string"""
+    args = request.args if args is None else args
+
+    limite = ler_limite(args, LIMITE_PADRAO, LIMITE_MAXIMO)
+
+    after = args.get('after') or None
+    before = args.get('before') or None
+    if after and before:
+        raise ParametroInvalido("Use apenas um dos parâmetros after ou before")
+
+    return limite, after, before
+
+
+def paginar(query, coluna_id, limite, after=None, before=None):
+    """
+    Aplica paginação keyset sobre a coluna de id (ULID, ordenável por tempo).
+
+    Retorna (itens, next_cursor, prev_cursor). Cada página custa uma busca
+    no índice da chave primária seguida de no máximo limite + 1 linhas,
+    independente do tamanho da tabela.
+    """
+    if before:
+        linhas = query.filter(coluna_id < before).order_by(coluna_id.desc()).limit(limite + 1).all()
+        tem_mais = len(linhas) > limite
+        linhas = list(reversed(linhas[:limite]))
+        prev_cursor = _chave(linhas[0]) if tem_mais and linhas else None
+        # Existe ao menos a linha do cursor "before" depois desta página
+        next_cursor = _chave(linhas[-1]) if linhas else None
+        return linhas, next_cursor, prev_cursor
+
+    if after:
+        query = query.filter(coluna_id > after)
+    linhas = query.order_by(coluna_id.asc()).limit(limite + 1).all()
+    tem_mais = len(linhas) > limite
+    linhas = linhas[:limite]
+    next_cursor = _chave(linhas[-1]) if tem_mais else None
+    prev_cursor = _chave(linhas[0]) if after and linhas else None
+    return linhas, next_cursor, prev_cursor
+
+
+def _chave(linha):
+    return linha.id
@@ -0,0 +1,156 @@
+# app/passwords.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from bcrypt import hashpw, gensalt, checkpw
+from flask import jsonify
+
+# Custo padrão do bcrypt (o mesmo de gensalt()) e faixa aceita pela biblioteca
+CUSTO_PADRAO = 12
+CUSTO_MINIMO = 4
+CUSTO_MAXIMO = 31
+
+
+class ServicoSenhasSaturado(Exception):
+    """Fila do bcrypt cheia ou espera acima do limite: responder 503"""
+    pass
+
+
+class ServicoSenhas:
+    """
+    Executa hashpw/checkpw em um pool limitado de threads (o bcrypt libera o
+    GIL durante o cálculo). Com `trabalhadores` ocupados e `fila_maxima`
+    aguardando, novas chamadas são rejeitadas na hora em vez de prender o
+    worker; a espera na fila é medida para as métricas.
+    """
+
+    def __init__(self, trabalhadores=None, fila_maxima=32, espera_maxima=10.0, custo=CUSTO_PADRAO):
+        self._lock = threading.Lock()
+        self._executor = None
+        self.configurar(trabalhadores, fila_maxima, espera_maxima, custo)
+
+    def configurar(self, trabalhadores=None, fila_maxima=32, espera_maxima=10.0, custo=CUSTO_PADRAO):
+        if not CUSTO_MINIMO <= custo <= CUSTO_MAXIMO:
+            raise ValueError(f"Custo do bcrypt deve estar entre {CUSTO_MINIMO} e {CUSTO_MAXIMO}")
+        with self._lock:
+            if self._executor:
+                self._executor.shutdown(wait=False)
+            self.custo = custo
+            self.trabalhadores = trabalhadores or os.cpu_count() or 1
+            self.fila_maxima = fila_maxima
+            self.espera_maxima = espera_maxima
+            self._executor = ThreadPoolExecutor(max_workers=self.trabalhadores, thread_name_prefix='bcrypt')
+            self.pendentes = 0
+            self.concluidos = 0
+            self.rejeitados = 0
+            self.tempo_espera_total = 0.0
+            self.tempo_espera_maximo = 0.0
+
+    def _executar(self, funcao, *args):
+        with self._lock:
+            if self.pendentes >= self.trabalhadores + self.fila_maxima:
+                self.rejeitados += 1
+                raise ServicoSenhasSaturado()
+            self.pendentes += 1
+            executor = self._executor
+        enfileirado_em = time.monotonic()
+
+        def tarefa():
+            espera = time.monotonic() - enfileirado_em
+            with self._lock:
+                self.tempo_espera_total += espera
+                self.tempo_espera_maximo = max(self.tempo_espera_maximo, espera)
+            try:
+                return funcao(*args)
+            finally:
+                with self._lock:
+                    self.pendentes -= 1
+                    self.concluidos += 1
+
+        futuro = executor.submit(tarefa)
+        try:
+            return futuro.result(timeout=self.espera_maxima)
+        except FuturesTimeoutError:
+            # Ainda na fila: sai dela, para não gastar CPU com uma resposta já descartada
+            cancelado = futuro.cancel()
+            with self._lock:
+                self.rejeitados += 1
+                if cancelado:
+                    self.pendentes -= 1
+            raise ServicoSenhasSaturado()
+
+    def gerar_hash(self, senha):
+        return self._executar(hashpw, senha.encode('utf-8'), gensalt(self.custo)).decode('utf-8')
+
+    def verificar(self, senha, senha_hash):
+        return self._executar(checkpw, senha.encode('utf-8'), senha_hash.encode('utf-8'))
+
+    def precisa_rehash(self, senha_hash):
+        """True quando o hash foi gerado com um custo diferente do configurado"""
+        return custo_do_hash(senha_hash) != self.custo
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "custo": self.custo,
+                "trabalhadores": self.trabalhadores,
+                "fila_maxima": self.fila_maxima,
+                "pendentes": self.pendentes,
+                "concluidos": self.concluidos,
+                "rejeitados": self.rejeitados,
+                "espera_media_ms": round(self.tempo_espera_total / self.concluidos * 1000, 2) if self.concluidos else None,
+                "espera_maxima_ms": round(self.tempo_espera_maximo * 1000, 2)
+            }
+
+
+servico_senhas = ServicoSenhas()
+
+
+def custo_do_hash(senha_hash):
+    """Custo gravado no hash ('$2b$12$...' -> 12) ou None se não for bcrypt"""
+    try:
+        return int(senha_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def medir_custo(custo, repeticoes=3):
+    """Menor tempo, em milissegundos, de um hashpw com o custo informado nesta máquina"""
+    sal = gensalt(custo)
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        hashpw(b'calibracao', sal)
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos) * 1000
+
+
+def calibrar_custo(alvo_ms, minimo=10, maximo=16):
+    """
+    Mede cada custo a partir de `minimo` e retorna (recomendado, medicoes): o
+    maior custo cujo hash fica dentro do alvo. Cada incremento dobra o tempo,
+    então a medição para no primeiro custo acima do alvo.
+    """
+    medicoes = {}
+    recomendado = minimo
+    for custo in range(minimo, maximo + 1):
+        medicoes[custo] = medir_custo(custo)
+        if medicoes[custo] > alvo_ms:
+            break
+        recomendado = custo
+    return recomendado, medicoes
+
+
+def gerar_hash_senha(senha):
+    return servico_senhas.gerar_hash(senha)
+
+
+def verificar_senha(senha, senha_hash):
+    return servico_senhas.verificar(senha, senha_hash)
+
+
+def resposta_saturado():
+    response = jsonify({"erro": "Servidor ocupado, tente novamente em instantes"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
@@ -0,0 +1,83 @@
+# app/queries.py
+from datetime import datetime, timedelta, timezone
+from flask import request
+from app.models.exam import Exam
+from app.pagination import ParametroInvalido
+
+
+def ler_data(valor, nome):
+    """
+    Converte 'YYYY-MM-DD' ou um timestamp ISO em (datetime, somente_data).
+    somente_data indica que o valor cobre o dia inteiro. Timestamps com fuso
+    são convertidos para UTC sem fuso, como created_at é gravado.
+    """
+    if not valor:
+        return None, False
+    try:
+        if len(valor) == 10:
+            return datetime.strptime(valor, '%Y-%m-%d'), True
+        data = datetime.fromisoformat(valor)
+        if data.tzinfo is not None:
+            data = data.astimezone(timezone.utc).replace(tzinfo=None)
+        return data, False
+    except ValueError:
+        raise ParametroInvalido(f"Parâmetro {nome} deve estar no formato YYYY-MM-DD ou ISO 8601")
+
+
+class FiltroExame:
+    """
+    Conjunto de filtros combináveis sobre exames, compilado em um único
+    SELECT com comparações de intervalo que aproveitam os índices.
+    """
+    def __init__(self, company_id=None, user_id=None, data_inicial=None, data_final=None,
+                 title=None, title_contains=None):
+        self.company_id = company_id
+        self.user_id = user_id
+        self.title = title
+        self.title_contains = title_contains
+
+        self.inicio, _ = ler_data(data_inicial, 'from')
+        fim, somente_data = ler_data(data_final, 'to')
+        # Data final informada só com o dia inclui o dia inteiro
+        self.fim = fim + timedelta(days=1) if fim and somente_data else fim
+        self.fim_inclusivo = bool(fim) and not somente_data
+
+        if self.inicio and self.fim and (self.inicio > self.fim or (self.inicio == self.fim and not self.fim_inclusivo)):
+            raise ParametroInvalido("Parâmetro from deve ser anterior a to")
+
+    @staticmethod
+    def from_args(args=None):
+        args = request.args if args is None else args
+        return FiltroExame(
+            company_id=args.get('company_id') or None,
+            user_id=args.get('user_id') or None,
+            data_inicial=args.get('from') or None,
+            data_final=args.get('to') or None,
+            title=args.get('title') or None,
+            title_contains=args.get('title_contains') or None
+        )
+
+    @staticmethod
+    def do_dia(data, **kwargs):
+        """Filtro cobrindo um único dia, usado pelas rotas listar_por_data*"""
+        return FiltroExame(data_inicial=data, data_final=data, **kwargs)
+
+    def condicoes(self):
+        condicoes = []
+        if self.company_id:
+            condicoes.append(Exam.company_id == self.company_id)
+        if self.user_id:
+            condicoes.append(Exam.user_id == self.user_id)
+        if self.inicio:
+            condicoes.append(Exam.created_at >= self.inicio)
+        if self.fim:
+            condicoes.append(Exam.created_at <= self.fim if self.fim_inclusivo else Exam.created_at < self.fim)
+        if self.title:
+            condicoes.append(Exam.title == self.title)
+        if self.title_contains:
+            condicoes.append(Exam.title.contains(self.title_contains))
+        return condicoes
+
+    def aplicar(self, query):
+        condicoes = self.condicoes()
+        return query.filter(*condicoes) if condicoes else query
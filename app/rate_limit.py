@@ -0,0 +1,145 @@
+# app/rate_limit.py
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from functools import wraps
+from flask import request, jsonify, current_app
+from app.models.identity import normalizar_email
+
+# Regras padrão: (capacidade do balde, fichas repostas por minuto)
+REGRAS_PADRAO = {
+    'ip': (20, 10),
+    'conta': (5, 5),
+}
+
+# A cada quantas verificações o processo remove baldes já cheios
+LIMPEZA_A_CADA = 1000
+
+
+def arquivo_limites(testing=False):
+    """Arquivo dos baldes: um por host; nos testes, um por processo"""
+    nome = f'giftxz_limites_teste_{os.getpid()}.db' if testing else 'giftxz_limites.db'
+    return os.path.join(tempfile.gettempdir(), nome)
+
+
+def ler_regra(texto):
+    """'20,10' -> (20, 10.0): capacidade e fichas por minuto"""
+    capacidade, por_minuto = texto.split(',')
+    return int(capacidade), float(por_minuto)
+
+
+class LimitadorTaxa:
+    """
+    Token bucket por chave ('login:ip:1.2.3.4', 'login:conta:x@y.com') em um
+    arquivo SQLite local, fora do banco principal, compartilhado pelos
+    processos do host. Cada consulta é uma transação curta de uma linha.
+    """
+
+    def __init__(self, arquivo=None, regras=None, ativo=True):
+        self._local = threading.local()
+        self._geracao = 0
+        self.configurar(arquivo, regras, ativo)
+
+    def configurar(self, arquivo=None, regras=None, ativo=True):
+        self.arquivo = arquivo or arquivo_limites()
+        self.regras = dict(regras or REGRAS_PADRAO)
+        self.ativo = ativo
+        self.rejeitados = 0
+        self._verificacoes = 0
+        # Conexões abertas para o arquivo anterior são descartadas na próxima consulta
+        self._geracao += 1
+
+    def _conexao(self):
+        if getattr(self._local, 'geracao', None) != self._geracao:
+            conn = sqlite3.connect(self.arquivo, timeout=1, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("""CREATE TABLE IF NOT EXISTS baldes (
+                chave TEXT PRIMARY KEY, fichas REAL NOT NULL, atualizado REAL NOT NULL
+            ) WITHOUT ROWID""")
+            self._local.conn, self._local.geracao = conn, self._geracao
+        return self._local.conn
+
+    def consumir(self, chave, capacidade, por_minuto, agora=None):
+        """
+        Retira uma ficha do balde da chave. Retorna 0 se permitido ou os
+        segundos até haver ficha disponível.
+        """
+        agora = time.time() if agora is None else agora
+        taxa = por_minuto / 60.0
+        conn = self._conexao()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            linha = conn.execute("SELECT fichas, atualizado FROM baldes WHERE chave = ?", (chave,)).fetchone()
+            fichas = capacidade if linha is None else min(capacidade, linha[0] + (agora - linha[1]) * taxa)
+            permitido = fichas >= 1
+            if permitido:
+                fichas -= 1
+            conn.execute("INSERT INTO baldes (chave, fichas, atualizado) VALUES (?, ?, ?) "
+                         "ON CONFLICT(chave) DO UPDATE SET fichas = excluded.fichas, atualizado = excluded.atualizado",
+                         (chave, fichas, agora))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return 0 if permitido else (1 - fichas) / taxa
+
+    def verificar(self, acao, ip, email=None):
+        """Consome dos baldes por IP e por conta; retorna os segundos de espera ou 0"""
+        if not self.ativo:
+            return 0
+        self._verificacoes += 1
+        if self._verificacoes % LIMPEZA_A_CADA == 0:
+            self.limpar()
+        chaves = [('ip', f'{acao}:ip:{ip}')]
+        if email:
+            chaves.append(('conta', f'{acao}:conta:{normalizar_email(email)}'))
+        for regra, chave in chaves:
+            capacidade, por_minuto = self.regras[regra]
+            espera = self.consumir(chave, capacidade, por_minuto)
+            if espera:
+                self.rejeitados += 1
+                return espera
+        return 0
+
+    def limpar(self, agora=None):
+        """Remove os baldes que já estariam cheios; retorna quantos foram removidos"""
+        agora = time.time() if agora is None else agora
+        # Tempo para encher o maior balde com a menor taxa
+        cheio_em = max(capacidade for capacidade, _ in self.regras.values()) * 60.0 / \
+            min(por_minuto for _, por_minuto in self.regras.values())
+        return self._conexao().execute("DELETE FROM baldes WHERE atualizado < ?", (agora - cheio_em,)).rowcount
+
+    def estatisticas(self):
+        return {"ativo": self.ativo, "rejeitados": self.rejeitados}
+
+
+limitador = LimitadorTaxa()
+
+
+def limitar_tentativas(acao):
+    """
+    Aplica os limites por IP e por e-mail do corpo JSON antes da rota, ou
+    seja, antes de qualquer consulta ao banco ou cálculo de bcrypt
+    """
+    def decorador(funcao):
+        @wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            dados = request.get_json(silent=True)
+            email = dados.get('email') if isinstance(dados, dict) and isinstance(dados.get('email'), str) else None
+            try:
+                espera = limitador.verificar(acao, request.remote_addr, email)
+            except sqlite3.Error as e:
+                # Sem o arquivo de limites a rota segue sem limitação
+                current_app.logger.error(f"Erro ao verificar limite de tentativas: {str(e)}")
+                espera = 0
+            if espera:
+                response = jsonify({"erro": "Muitas tentativas, tente novamente mais tarde"})
+                response.headers['Retry-After'] = str(math.ceil(espera))
+                return response, 429
+            return funcao(*args, **kwargs)
+        return envoltorio
+    return decorador
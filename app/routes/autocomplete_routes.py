@@ -0,0 +1,27 @@
+from flask import Blueprint, request, jsonify, current_app
+from app.autocomplete import autocomplete, TIPOS
+from app.pagination import ler_limite_busca, ParametroInvalido
+
+autocomplete_bp = Blueprint('autocomplete', __name__)
+
+@autocomplete_bp.route('/autocomplete', methods=['GET'])
+def sugerir():
+    """
+    Sugestões de nomes de usuários e empresas que começam com ?q= (em qualquer
+    palavra, sem acentos), respondidas do índice em memória do worker.
+    ?tipo=usuario|empresa restringe a busca.
+    """
+    try:
+        termo = request.args.get('q', '')
+        if not termo.strip():
+            return jsonify({"erro": "Parâmetro q é obrigatório"}), 400
+        tipo = request.args.get('tipo') or None
+        if tipo and tipo not in TIPOS.values():
+            return jsonify({"erro": "Parâmetro tipo deve ser usuario ou empresa"}), 400
+        limite = ler_limite_busca()
+        return jsonify(autocomplete.buscar(termo, limite, tipo)), 200
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Erro ao buscar sugestões: {str(e)}")
+        return jsonify({"erro": "Erro ao buscar sugestões"}), 500
@@ -1,51 +1,54 @@
 from flask import Blueprint, request, jsonify, current_app, url_for
 from app.models.company import Company, PendingCompany, CompanyDTO
-from app import get_db, mail
-from flask_mail import Message
-from bcrypt import hashpw, gensalt
-from datetime import datetime, timedelta
+from app import get_db
+from app.models.outbox import enfileirar_email
+from app.models.pending import remover_pendentes_expirados
+from app.models.refresh_token import revogar_tokens_da_conta
+from app.passwords import gerar_hash_senha, ServicoSenhasSaturado, resposta_saturado
+from app.serializers import CAMPOS_EMPRESA, CAMPOS_VERSAO, colunas, linha_para_dict, linhas_para_dicts
+from app.name_search import buscar_por_nome
+from app.models.identity import resolver_identidade
+from sqlalchemy.exc import IntegrityError
+from app.pagination import ler_limite_busca, ParametroInvalido
+from app.conditional import calcular_etag, resposta_serializada, ultima_modificacao
+from app.cache import cache_entidades
+from app.ids import id_canonico
+from app.rate_limit import limitar_tentativas
 import ulid
 
-from app.models.user import User
-
 company_bp = Blueprint('company', __name__)
 
-def enviar_email(para, assunto, template):
+def enviar_email(db, para, assunto, template):
+    """Grava o e-mail na outbox da transação de db; o envio é feito em segundo plano"""
     try:
-        msg = Message(assunto, recipients=[para], html=template, sender=current_app.config['MAIL_USERNAME'])
-        mail.send(msg)
+        enfileirar_email(db, para, assunto, template)
     except Exception as e:
         current_app.logger.error(f"Erro ao enviar e-mail: {str(e)}")
         raise
 
-def enviar_email_verificacao(company_dto: CompanyDTO):
+def enviar_email_verificacao(db, company_dto: CompanyDTO):
     try:
         token = company_dto.to_jwt()
         confirm_url = url_for('company_blueprint.confirmar', token=token, _external=True)
         html = f'<b>Bem-vindo! Por favor, confirme seu e-mail clicando <a href="{confirm_url}">aqui</a>.</b>'
         assunto = "Por favor, confirme seu e-mail"
-        enviar_email(company_dto.email, assunto, html)
+        enviar_email(db, company_dto.email, assunto, html)
     except Exception as e:
         current_app.logger.error(f"Erro ao enviar e-mail de verificação: {str(e)}")
         raise
 
 @company_bp.route('/empresa/registrar', methods=['POST'])
+@limitar_tentativas('registro')
 def registrar():
     try:
         dados = request.get_json()
         if not dados:
             return jsonify({"erro": "Nenhum dado de entrada fornecido"}), 400
 
-        # Verifica se o e-mail já está registrado ou pendente
+        # Verifica se o e-mail já está registrado ou pendente (usuários e empresas)
         db = get_db()
 
-        existing_company = db.query(Company).filter_by(email=dados['email']).first()
-        existing_user = db.query(User).filter_by(email=dados['email']).first()
-        if existing_company or existing_user:
-            return jsonify({"erro": "E-mail já registrado ou pendente de confirmação"}), 400
-        
-        existing_pending = db.query(PendingCompany).filter_by(email=dados['email']).first()
-        if existing_company or existing_pending:
+        if resolver_identidade(db, dados['email']):
             return jsonify({"erro": "E-mail já registrado ou pendente de confirmação"}), 400
 
         # Cria um PendingCompany temporário
@@ -55,17 +58,25 @@ def registrar():
             phone=dados['phone'],
             cnpj=dados['cnpj'],
             email=dados['email'],
-            password_hash=hashpw(dados['password'].encode('utf-8'), gensalt()).decode('utf-8')
+            password_hash=gerar_hash_senha(dados['password'])
         )
 
         db.add(pending_company)
-        db.commit()
 
-        # Envia o e-mail de confirmação
+        # O e-mail de confirmação vai para a outbox no mesmo commit do cadastro
         company_dto = CompanyDTO(name=pending_company.name, address=pending_company.address, phone=pending_company.phone, cnpj=pending_company.cnpj, email=pending_company.email, password=None)
-        enviar_email_verificacao(company_dto)
+        enviar_email_verificacao(db, company_dto)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Outro cadastro com o mesmo e-mail foi gravado após a verificação
+            db.rollback()
+            return jsonify({"erro": "E-mail já registrado ou pendente de confirmação"}), 400
 
         return jsonify({"mensagem": "Verifique seu e-mail para confirmar a conta."}), 201
+    except ServicoSenhasSaturado:
+        db.rollback()
+        return resposta_saturado()
     except Exception as e:
         db.rollback()
         current_app.logger.error(f"Erro ao registrar empresa: {str(e)}")
@@ -79,7 +90,7 @@ def confirmar(token):
         if not company_dto:
             return jsonify({"erro": "Token inválido ou expirado"}), 400
 
-        db = get_db()
+        db = get_db(leitura=False)  # GET que grava: confirma o cadastro
 
         # Busca o PendingCompany correspondente
         pending_company = db.query(PendingCompany).filter_by(email=company_dto.email).first()
@@ -135,9 +146,11 @@ def redefinir_senha():
         reset_url = url_for('company_blueprint.confirmar_redefinicao', token=token, _external=True)
         html = f'<b>Para redefinir sua senha, clique <a href="{reset_url}">aqui</a>.</b>'
         assunto = "Redefinição de senha"
-        enviar_email(company.email, assunto, html)
+        enviar_email(db, company.email, assunto, html)
+        db.commit()
         return jsonify({"mensagem": "E-mail de redefinição de senha enviado com sucesso."}), 200
     except Exception as e:
+        db.rollback()
         current_app.logger.error(f"Erro ao enviar e-mail de redefinição de senha: {str(e)}")
         return jsonify({"erro": "Erro ao enviar e-mail de redefinição de senha"}), 500
 
@@ -161,14 +174,9 @@ def confirmar_redefinicao(token):
 def limpar_pendentes():
     try:
         db = get_db()
-        # Define o limite de expiração como uma hora atrás
-        limite_expiracao = datetime.utcnow() - timedelta(hours=1)
-        # Remove todos os registros expirados
-        expirados = db.query(PendingCompany).filter(PendingCompany.expiration < limite_expiracao).all()
-        for pendente in expirados:
-            db.delete(pendente)
-        db.commit()
-        return jsonify({"mensagem": f"{len(expirados)} registros expirados removidos."}), 200
+        # Remove em lotes os registros expirados há mais de uma hora
+        removidos = remover_pendentes_expirados(db, PendingCompany)
+        return jsonify({"mensagem": f"{removidos} registros expirados removidos.", "removidos": removidos}), 200
     except Exception as e:
         db.rollback()
         current_app.logger.error(f"Erro ao limpar pending_companies: {str(e)}")
@@ -177,20 +185,20 @@ def limpar_pendentes():
 @company_bp.route('/empresa/obter/<id>', methods=['GET'])
 def obter(id):
     try:
-        db = get_db()
-        company = db.query(Company).get(id)
-
-        if not company:
+        def carregar():
+            # O cache é preenchido pela principal: uma réplica atrasada o deixaria
+            # com o valor anterior a uma alteração já invalidada, por todo o TTL
+            db = get_db(leitura=False)
+            company = db.query(*colunas(Company, CAMPOS_EMPRESA + CAMPOS_VERSAO)).filter(Company.id == id).first()
+            if not company:
+                return None
+            return linha_para_dict(company, CAMPOS_EMPRESA), calcular_etag(tuple(company)), ultima_modificacao([company.updated_at])
+
+        em_cache = cache_entidades.obter_ou_carregar(('empresa', id_canonico(id)), carregar)
+        if not em_cache:
             return jsonify({"erro": "Empresa não encontrada"}), 404
 
-        return jsonify({
-            "id": company.id,
-            "name": company.name,
-            "address": company.address,
-            "phone": company.phone,
-            "cnpj": company.cnpj,
-            "email": company.email
-        }), 200
+        return resposta_serializada(*em_cache)
     except Exception as e:
         current_app.logger.error(f"Erro ao obter empresa: {str(e)}")
         return jsonify({"erro": "Erro ao obter empresa"}), 500
@@ -199,19 +207,12 @@ def obter(id):
 @company_bp.route('/empresas/find_by_substring/<substring>', methods=['GET'])
 def find_by_substring(substring):
     try:
+        limite = ler_limite_busca()
         db = get_db()
-        companies = db.query(Company).filter(Company.name.contains(substring)).all()
-        company_list = []
-        for company in companies:
-            company_list.append({
-                "id": company.id,
-                "name": company.name,
-                "address": company.address,
-                "phone": company.phone,
-                "cnpj": company.cnpj,
-                "email": company.email
-            })
-        return jsonify(company_list), 200
+        companies = buscar_por_nome(db, Company, substring, CAMPOS_EMPRESA, limite)
+        return jsonify(linhas_para_dicts(companies, CAMPOS_EMPRESA)), 200
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
     except Exception as e:
         current_app.logger.error(f"Erro ao buscar empresas por substring: {str(e)}")
         return jsonify({"erro": "Erro ao buscar empresas por substring"}), 500
@@ -233,10 +234,15 @@ def nova_senha():
         if not company:
             return jsonify({"erro": "Empresa não encontrada"}), 404
 
-        company.password_hash = hashpw(password.encode('utf-8'), gensalt()).decode('utf-8')
+        company.password_hash = gerar_hash_senha(password)
+        # Refresh tokens emitidos com a senha antiga deixam de valer
+        revogar_tokens_da_conta(db, company.id)
         db.commit()
 
         return jsonify({"mensagem": "Senha alterada com sucesso"}), 200
+    except ServicoSenhasSaturado:
+        db.rollback()
+        return resposta_saturado()
     except Exception as e:
         db.rollback()
         current_app.logger.error(f"Erro ao alterar senha: {str(e)}")
@@ -1,6 +1,19 @@
-from flask import Blueprint, render_template, request, jsonify, current_app
+import csv
+import io
+import json
+from collections import Counter
+from datetime import datetime
+from flask import Blueprint, render_template, request, jsonify, current_app, Response, stream_with_context
 from app.models.exam import Exam
+from app.models.exam_stats import ExamCompanyDaily, ExamUserMonthly, contabilizar, aplicar_deltas
 from app import get_db
+from app.pagination import ler_parametros_paginacao, paginar, ParametroInvalido
+from app.queries import FiltroExame
+from app.serializers import CAMPOS_EXAME, CAMPOS_EXAME_EXPORTACAO, CAMPOS_VERSAO, colunas_exame, linha_para_dict, linhas_para_dicts
+from app.search import pesquisar_exames
+from app.conditional import calcular_etag, resposta_condicional, resposta_serializada, ultima_modificacao
+from app.cache import cache_entidades
+from app.ids import id_canonico, novo_ulid
 
 exam_bp = Blueprint('exam', __name__)
 
@@ -32,22 +45,130 @@ def criar():
         current_app.logger.error(f"Erro ao criar exame: {str(e)}")
         return jsonify({"erro": "Erro ao criar exame"}), 500
 
+# Tamanho padrão e máximo do lote de inserção da importação em massa
+LOTE_IMPORTACAO = 500
+LOTE_IMPORTACAO_MAXIMO = 5000
+# Erros detalhados na resposta da importação; os demais entram só em total_erros
+ERROS_IMPORTACAO_MAXIMO = 100
+
+def validar_linha_importacao(texto):
+    """Converte uma linha NDJSON em valores para insert ou lança ValueError"""
+    try:
+        data = json.loads(texto)
+    except ValueError:
+        raise ValueError("JSON inválido")
+    if not isinstance(data, dict):
+        raise ValueError("Cada linha deve ser um objeto JSON")
+    if not data.get('title') or not data.get('company_id') or not data.get('user_id'):
+        raise ValueError("Título, company_id e user_id são obrigatórios")
+    for campo in ('title', 'description', 'company_id', 'user_id'):
+        if data.get(campo) is not None and not isinstance(data[campo], str):
+            raise ValueError(f"Campo {campo} deve ser texto")
+    if len(data['title']) > 100:
+        raise ValueError("Título deve ter no máximo 100 caracteres")
+    if data.get('description') and len(data['description']) > 500:
+        raise ValueError("Descrição deve ter no máximo 500 caracteres")
+    return {
+        "id": novo_ulid(),
+        "created_at": datetime.utcnow(),
+        "title": data['title'],
+        "description": data.get('description'),
+        "company_id": data['company_id'],
+        "user_id": data['user_id']
+    }
+
+def inserir_lote(db, lote):
+    """Insere o lote com um único executemany e um commit"""
+    linhas = [valores for _, valores in lote]
+    db.execute(Exam.__table__.insert(), linhas)
+    # O insert em massa não passa pelo flush do ORM; atualiza os agregados aqui
+    deltas = Counter()
+    for linha in linhas:
+        contabilizar(deltas, linha['company_id'], linha['user_id'], linha['created_at'], 1)
+    aplicar_deltas(db, deltas)
+    db.commit()
+
+@exam_bp.route('/exames/importar', methods=['POST'])
+def importar():
+    """
+    Importa exames a partir de um corpo NDJSON (um exame por linha), lido em
+    streaming e gravado em lotes (?lote=, padrão 500). Linhas inválidas são
+    reportadas sem interromper o restante da importação: as primeiras em
+    erros e todas em total_erros.
+    """
+    try:
+        tamanho_lote = int(request.args.get('lote', current_app.config.get('IMPORTACAO_LOTE', LOTE_IMPORTACAO)))
+    except ValueError:
+        return jsonify({"erro": "Parâmetro lote deve ser um número inteiro"}), 400
+    if tamanho_lote < 1 or tamanho_lote > LOTE_IMPORTACAO_MAXIMO:
+        return jsonify({"erro": f"Parâmetro lote deve estar entre 1 e {LOTE_IMPORTACAO_MAXIMO}"}), 400
+
+    db = get_db()
+    inseridos = 0
+    erros = []
+    total_erros = 0
+    limite_erros = current_app.config.get('IMPORTACAO_ERROS_MAXIMO', ERROS_IMPORTACAO_MAXIMO)
+    lote = []
+
+    def registrar_erro(numero, mensagem):
+        nonlocal total_erros
+        total_erros += 1
+        if len(erros) < limite_erros:
+            erros.append({"linha": numero, "erro": mensagem})
+
+    def gravar():
+        try:
+            inserir_lote(db, lote)
+            return len(lote)
+        except Exception as e:
+            db.rollback()
+            current_app.logger.error(f"Erro ao importar lote de exames: {str(e)}")
+            for numero, _ in lote:
+                registrar_erro(numero, "Erro ao gravar o lote")
+            return 0
+
+    try:
+        for numero, texto in enumerate(request.stream, start=1):
+            texto = texto.strip()
+            if not texto:
+                continue
+            try:
+                lote.append((numero, validar_linha_importacao(texto)))
+            except ValueError as e:
+                registrar_erro(numero, str(e))
+                continue
+            if len(lote) >= tamanho_lote:
+                inseridos += gravar()
+                lote = []
+        if lote:
+            inseridos += gravar()
+    except Exception as e:
+        db.rollback()
+        current_app.logger.error(f"Erro ao importar exames: {str(e)}")
+        return jsonify({"erro": "Erro ao importar exames", "inseridos": inseridos,
+                        "erros": erros, "total_erros": total_erros}), 500
+
+    if not inseridos and not total_erros:
+        return jsonify({"erro": "Nenhum dado de entrada fornecido"}), 400
+    return jsonify({"inseridos": inseridos, "erros": erros, "total_erros": total_erros}), 200
+
 @exam_bp.route('/exames/obter/<id>', methods=['GET'])
 def obter(id):
     try:
-        db = get_db()
-        exam = db.query(Exam).get(id)
-
-        if not exam:
+        def carregar():
+            # O cache é preenchido pela principal: uma réplica atrasada o deixaria
+            # com o valor anterior a uma alteração já invalidada, por todo o TTL
+            db = get_db(leitura=False)
+            exam = db.query(*colunas_exame(CAMPOS_EXAME + CAMPOS_VERSAO)).filter(Exam.id == id).first()
+            if not exam:
+                return None
+            return linha_para_dict(exam, CAMPOS_EXAME), calcular_etag(tuple(exam)), ultima_modificacao([exam.updated_at])
+
+        em_cache = cache_entidades.obter_ou_carregar(('exame', id_canonico(id)), carregar)
+        if not em_cache:
             return jsonify({"erro": "Exame não encontrado"}), 404
 
-        return jsonify({
-            "id": exam.id,
-            "title": exam.title,
-            "description": exam.description,
-            "company_id": exam.company_id,
-            "user_id": exam.user_id
-        }), 200
+        return resposta_serializada(*em_cache)
     except Exception as e:
         current_app.logger.error(f"Erro ao obter exame: {str(e)}")
         return jsonify({"erro": "Erro ao obter exame"}), 500
@@ -97,147 +218,206 @@ def deletar(id):
         current_app.logger.error(f"Erro ao excluir exame: {str(e)}")
         return jsonify({"erro": "Erro ao excluir exame"}), 500
 
-@exam_bp.route('/exames/listar', methods=['GET'])
-def listar():
+def listar_paginado(query):
+    """
+    Executa a query projetada com paginação por cursor e monta a resposta
+    padrão das listagens, com ETag calculado da página. Sem Last-Modified:
+    o maior updated_at não muda quando um exame sai da página (exclusão ou
+    filtro), e If-Modified-Since responderia 304 com a lista antiga.
+    """
+    limite, after, before = ler_parametros_paginacao()
+    linhas, next_cursor, prev_cursor = paginar(query, Exam.id, limite, after=after, before=before)
+    etag = calcular_etag(request.path, [tuple(linha) for linha in linhas], next_cursor, prev_cursor)
+    return resposta_condicional(lambda: {
+        "exames": linhas_para_dicts(linhas, CAMPOS_EXAME),
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor
+    }, etag)
+
+def responder_busca(criar_filtro, descricao):
+    """Executa uma busca filtrada e paginada; descricao compõe as mensagens de erro"""
     try:
+        filtro = criar_filtro()
         db = get_db()
-        exams = db.query(Exam).all()
-        exam_list = []
-        for exam in exams:
-            exam_list.append({
-                "id": exam.id,
-                "title": exam.title,
-                "description": exam.description,
-                "company_id": exam.company_id,
-                "user_id": exam.user_id
-            })
-        return jsonify(exam_list), 200
+        return listar_paginado(filtro.aplicar(db.query(*colunas_exame(CAMPOS_EXAME + CAMPOS_VERSAO))))
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
     except Exception as e:
-        current_app.logger.error(f"Erro ao listar exames: {str(e)}")
-        return jsonify({"erro": "Erro ao listar exames"}), 500
+        current_app.logger.error(f"Erro ao {descricao}: {str(e)}")
+        return jsonify({"erro": f"Erro ao {descricao}"}), 500
+
+@exam_bp.route('/exames/buscar', methods=['GET'])
+def buscar():
+    """
+    Busca exames combinando company_id, user_id, from/to (YYYY-MM-DD ou ISO 8601),
+    title e title_contains, com paginação por cursor
+    """
+    return responder_busca(FiltroExame.from_args, "buscar exames")
+
+@exam_bp.route('/exames/listar', methods=['GET'])
+def listar():
+    return responder_busca(FiltroExame, "listar exames")
 
 @exam_bp.route('/exames/listar_por_usuario/<user_id>', methods=['GET'])
 def listar_por_usuario(user_id):
-    try:
-        db = get_db()
-        exams = db.query(Exam).filter(Exam.user_id == user_id).all()
-        exam_list = []
-        for exam in exams:
-            exam_list.append({
-                "id": exam.id,
-                "title": exam.title,
-                "description": exam.description,
-                "company_id": exam.company_id,
-                "user_id": exam.user_id
-            })
-        return jsonify(exam_list), 200
-    except Exception as e:
-        current_app.logger.error(f"Erro ao listar exames por usuário: {str(e)}")
-        return jsonify({"erro": "Erro ao listar exames por usuário"}), 500
+    return responder_busca(lambda: FiltroExame(user_id=user_id), "listar exames por usuário")
 
 @exam_bp.route('/exames/listar_por_empresa/<company_id>', methods=['GET'])
 def listar_por_empresa(company_id):
-    try:
-        db = get_db()
-        exams = db.query(Exam).filter(Exam.company_id == company_id).all()
-        exam_list = []
-        for exam in exams:
-            exam_list.append({
-                "id": exam.id,
-                "title": exam.title,
-                "description": exam.description,
-                "company_id": exam.company_id,
-                "user_id": exam.user_id
-            })
-        return jsonify(exam_list), 200
-    except Exception as e:
-        current_app.logger.error(f"Erro ao listar exames por empresa: {str(e)}")
-        return jsonify({"erro": "Erro ao listar exames por empresa"}), 500
-
-    
-    #filtrar por data lembrando que base tem um campo created_at
+    return responder_busca(lambda: FiltroExame(company_id=company_id), "listar exames por empresa")
 
 @exam_bp.route('/exames/listar_por_data/<data>', methods=['GET'])
 def listar_por_data(data):
-    try:
-        db = get_db()
-        exams = db.query(Exam).filter(Exam.created_at == data).all()
-        exam_list = []
-        for exam in exams:
-            exam_list.append({
-                "id": exam.id,
-                "title": exam.title,
-                "description": exam.description,
-                "company_id": exam.company_id,
-                "user_id": exam.user_id
-            })
-        return jsonify(exam_list), 200
-    except Exception as e:
-        current_app.logger.error(f"Erro ao listar exames por data: {str(e)}")
-        return jsonify({"erro": "Erro ao listar exames por data"}), 500
-
-#filtrar por data e empresa, e outro filtro por data e usuario
+    return responder_busca(lambda: FiltroExame.do_dia(data), "listar exames por data")
 
 @exam_bp.route('/exames/listar_por_data_empresa/<data>/<company_id>', methods=['GET'])
 def listar_por_data_empresa(data, company_id):
-    try:
-        db = get_db()
-        exams = db.query(Exam).filter(Exam.created_at == data, Exam.company_id == company_id).all()
-        exam_list = []
-        for exam in exams:
-            exam_list.append({
-                "id": exam.id,
-                "title": exam.title,
-                "description": exam.description,
-                "company_id": exam.company_id,
-                "user_id": exam.user_id
-            })
-        return jsonify(exam_list), 200
-    except Exception as e:
-        current_app.logger.error(f"Erro ao listar exames por data e empresa: {str(e)}")
-        return jsonify({"erro": "Erro ao listar exames por data e empresa"}), 500
-
+    return responder_busca(lambda: FiltroExame.do_dia(data, company_id=company_id),
+                           "listar exames por data e empresa")
 
 @exam_bp.route('/exames/listar_por_data_usuario/<data>/<user_id>', methods=['GET'])
 def listar_por_data_usuario(data, user_id):
+    return responder_busca(lambda: FiltroExame.do_dia(data, user_id=user_id),
+                           "listar exames por data e usuário")
 
+@exam_bp.route('/exames/listar_por_data_usuario_empresa/<data>/<user_id>/<company_id>', methods=['GET'])
+def listar_por_data_usuario_empresa(data, user_id, company_id):
+    return responder_busca(lambda: FiltroExame.do_dia(data, user_id=user_id, company_id=company_id),
+                           "listar exames por data, usuário e empresa")
+
+@exam_bp.route('/exames/pesquisar', methods=['GET'])
+def pesquisar():
+    """
+    Pesquisa textual em título e descrição (?q=), sem diferenciar acentos e
+    maiúsculas; cada palavra casa como prefixo. Resultados por relevância.
+    """
     try:
+        termos = request.args.get('q', '').strip()
+        if not termos:
+            return jsonify({"erro": "Parâmetro q é obrigatório"}), 400
+        limite, _, _ = ler_parametros_paginacao()
+        try:
+            deslocamento = int(request.args.get('offset', 0))
+        except ValueError:
+            raise ParametroInvalido("Parâmetro offset deve ser um número inteiro")
+        if deslocamento < 0:
+            raise ParametroInvalido("Parâmetro offset deve ser positivo")
+
         db = get_db()
-        exams = db.query(Exam).filter(Exam.created_at == data, Exam.user_id == user_id).all()
-        exam_list = []
-        for exam in exams:
-            exam_list.append({
-                "id": exam.id,
-                "title": exam.title,
-                "description": exam.description,
-                "company_id": exam.company_id,
-                "user_id": exam.user_id
-            })
-        return jsonify(exam_list), 200
+        if db.get_bind().dialect.name != 'sqlite':
+            return jsonify({"erro": "Pesquisa textual indisponível neste banco de dados"}), 501
+        linhas = pesquisar_exames(db, termos, CAMPOS_EXAME, limite, deslocamento)
+        return jsonify({"exames": linhas_para_dicts(linhas, CAMPOS_EXAME)}), 200
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
     except Exception as e:
-        current_app.logger.error(f"Erro ao listar exames por data e usuário: {str(e)}")
-        return jsonify({"erro": "Erro ao listar exames por data e usuário"}), 500
-
-@exam_bp.route('/exames/listar_por_data_usuario_empresa/<data>/<user_id>/<company_id>', methods=['GET'])
+        current_app.logger.error(f"Erro ao pesquisar exames: {str(e)}")
+        return jsonify({"erro": "Erro ao pesquisar exames"}), 500
 
-def listar_por_data_usuario_empresa(data, user_id, company_id):
+def ler_periodo(valor, formato, nome):
+    if not valor:
+        return None
+    try:
+        datetime.strptime(valor, formato)
+    except ValueError:
+        raise ParametroInvalido(f"Parâmetro {nome} inválido")
+    return valor
+
+@exam_bp.route('/exames/estatisticas', methods=['GET'])
+def estatisticas():
+    """
+    Totais de exames lidos das tabelas de agregação:
+    ?company_id=&from=YYYY-MM-DD&to=YYYY-MM-DD (por dia) ou
+    ?user_id=&from=YYYY-MM&to=YYYY-MM (por mês)
+    """
     try:
+        company_id = request.args.get('company_id')
+        user_id = request.args.get('user_id')
+        if bool(company_id) == bool(user_id):
+            return jsonify({"erro": "Informe company_id ou user_id"}), 400
+
+        if company_id:
+            modelo, coluna, periodo, formato, chave = ExamCompanyDaily, ExamCompanyDaily.company_id, ExamCompanyDaily.day, '%Y-%m-%d', 'dia'
+        else:
+            modelo, coluna, periodo, formato, chave = ExamUserMonthly, ExamUserMonthly.user_id, ExamUserMonthly.month, '%Y-%m', 'mes'
+        inicio = ler_periodo(request.args.get('from'), formato, 'from')
+        fim = ler_periodo(request.args.get('to'), formato, 'to')
+
         db = get_db()
-        exams = db.query(Exam).filter(Exam.created_at == data, Exam.user_id == user_id, Exam.company_id == company_id).all()
-        exam_list = []
-        for exam in exams:
-            exam_list.append({
-                "id": exam.id,
-                "title": exam.title,
-                "description": exam.description,
-                "company_id": exam.company_id,
-                "user_id": exam.user_id
-            })
-        return jsonify(exam_list), 200
+        query = db.query(periodo, modelo.total).filter(coluna == (company_id or user_id))
+        if inicio:
+            query = query.filter(periodo >= inicio)
+        if fim:
+            query = query.filter(periodo <= fim)
+        periodos = [{chave: p, "total": total} for p, total in query.order_by(periodo) if total]
+
+        resposta = {"company_id": company_id} if company_id else {"user_id": user_id}
+        resposta["dias" if company_id else "meses"] = periodos
+        resposta["total"] = sum(p["total"] for p in periodos)
+        return jsonify(resposta), 200
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
     except Exception as e:
+        current_app.logger.error(f"Erro ao obter estatísticas de exames: {str(e)}")
+        return jsonify({"erro": "Erro ao obter estatísticas de exames"}), 500
+
+# Tamanho do lote lido do cursor do banco na exportação
+LOTE_EXPORTACAO = 1000
+
+def linhas_exportacao(db, filtro):
+    """Percorre os exames em lotes sem materializar a consulta nem objetos ORM"""
+    query = filtro.aplicar(db.query(*colunas_exame(CAMPOS_EXAME_EXPORTACAO))).order_by(Exam.id)
+    for linha in query.execution_options(stream_results=True).yield_per(LOTE_EXPORTACAO):
+        yield linha_para_dict(linha, CAMPOS_EXAME_EXPORTACAO)
+
+def gerar_ndjson(registros):
+    for registro in registros:
+        yield json.dumps(registro, ensure_ascii=False) + '\n'
+
+def gerar_csv(registros):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CAMPOS_EXAME_EXPORTACAO)
+    writer.writeheader()
+    for registro in registros:
+        writer.writerow(registro)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    yield buffer.getvalue()
+
+@exam_bp.route('/exames/exportar', methods=['GET'])
+def exportar():
+    """
+    Exporta exames em NDJSON (padrão) ou CSV via ?formato=, aceitando os mesmos
+    filtros de /exames/buscar. As linhas são enviadas conforme lidas do banco.
+    """
+    try:
+        formato = request.args.get('formato', 'ndjson')
+        if formato not in ('ndjson', 'csv'):
+            return jsonify({"erro": "Formato deve ser ndjson ou csv"}), 400
+        filtro = FiltroExame.from_args()
+        db = get_db()
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
+
+    def gerar():
+        try:
+            registros = linhas_exportacao(db, filtro)
+            if formato == 'csv':
+                yield from gerar_csv(registros)
+            else:
+                yield from gerar_ndjson(registros)
+        except Exception as e:
+            # O status já foi enviado: propaga o erro para o servidor abortar a
+            # resposta chunked e o cliente perceber que o arquivo veio incompleto
+            current_app.logger.error(f"Erro ao exportar exames: {str(e)}")
+            raise
+
+    if formato == 'csv':
+        return Response(stream_with_context(gerar()), mimetype='text/csv',
+                        headers={'Content-Disposition': 'attachment; filename=exames.csv'})
+    return Response(stream_with_context(gerar()), mimetype='application/x-ndjson')
 
-        current_app.logger.error(f"Erro ao listar exames por data, usuário e empresa: {str(e)}")
-        return jsonify({"erro": "Erro ao listar exames por data, usuário e empresa"}), 500
 @exam_bp.route('/upload', methods=['GET'])
 def show_upload_form():
     return render_template('upload.html')
\ No newline at end of file
@@ -1,15 +1,34 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, g
 from app.database import get_db
 from app.models.user import User
 from app.models.company import Company
-from bcrypt import checkpw
-import jwt
-from datetime import datetime, timezone, timedelta  # Importação corrigida
+from app.models.identity import IdentityKind, resolver_identidade
+from app.passwords import servico_senhas, verificar_senha, gerar_hash_senha, ServicoSenhasSaturado, resposta_saturado
+from app.rate_limit import limitar_tentativas
+from app.auth import emitir_token_acesso, autenticado
+from app.models.refresh_token import emitir_refresh_token, rotacionar_refresh_token, RefreshTokenInvalido
+from datetime import timedelta
 
 # Criando o Blueprint para rotas de autenticação
 auth_bp = Blueprint('auth', __name__)
 
+def atualizar_hash(db, conta, senha):
+    """
+    Regrava o hash com o custo configurado após um login válido. Falhas não
+    impedem o login: a conta tenta de novo na próxima autenticação.
+    """
+    try:
+        conta.password_hash = gerar_hash_senha(senha)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        current_app.logger.error(f"Erro ao atualizar hash da senha: {str(e)}")
+
+def validade_refresh():
+    return timedelta(days=current_app.config.get('REFRESH_TOKEN_DIAS', 30))
+
 @auth_bp.route('/login', methods=['POST'])
+@limitar_tentativas('login')
 def login():
     """
     Autentica um usuário e retorna um token JWT
@@ -21,24 +40,63 @@ def login():
 
     db = get_db()
     
-    # Verifica se é um usuário
-    user = db.query(User).filter_by(email=data['email']).first()
-    company = db.query(Company).filter_by(email=data['email']).first()
-    
-    if not user and not company:
+    # Uma busca no registro de e-mails resolve se é usuário ou empresa
+    identidade = resolver_identidade(db, data['email'])
+    if not identidade or identidade.kind not in IdentityKind.CONTAS:
         return jsonify({'message': 'Email ou senha inválidos'}), 404
     
-    print("""
-            
-          """)
-    if user and checkpw(data['password'].encode('utf-8'), user.password_hash.encode('utf-8')):
-        token = jwt.encode({'sub': user.id, 'exp': datetime.now(timezone.utc) + timedelta(hours=1)}, current_app.config['SECRET_KEY'], algorithm='HS256')
-        return jsonify({'token': token})
+    modelo = User if identidade.kind == IdentityKind.USUARIO else Company
+    conta = db.get(modelo, identidade.entity_id)
     
-    if company and checkpw(data['password'].encode('utf-8'), company.password_hash.encode('utf-8')):   
-        token = jwt.encode({'sub': company.id, 'exp': datetime.now(timezone.utc) + timedelta(hours=1)}, current_app.config['SECRET_KEY'], algorithm='HS256')
-        return jsonify({'token': token})
+    try:
+        senha_valida = conta is not None and verificar_senha(data['password'], conta.password_hash)
+    except ServicoSenhasSaturado:
+        return resposta_saturado()
+
+    if senha_valida:
+        if servico_senhas.precisa_rehash(conta.password_hash):
+            atualizar_hash(db, conta, data['password'])
+        token = emitir_token_acesso(conta.id, identidade.kind)
+        try:
+            refresh_token = emitir_refresh_token(db, conta.id, identidade.kind, validade=validade_refresh())
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            current_app.logger.error(f"Erro ao emitir refresh token: {str(e)}")
+            return jsonify({'message': 'Erro ao autenticar'}), 500
+        return jsonify({'token': token, 'refresh_token': refresh_token})
     
     return jsonify({'message': 'Email ou senha inválidos'   }), 401
-    
 
+@auth_bp.route('/conta', methods=['GET'])
+@autenticado()
+def conta_autenticada():
+    """
+    Retorna a conta (usuário ou empresa) do token de acesso enviado
+    """
+    return jsonify(g.principal), 200
+
+@auth_bp.route('/token/refresh', methods=['POST'])
+def renovar_token():
+    """
+    Troca um refresh token por um novo token de acesso e um novo refresh
+    token, sem verificar a senha. Cada refresh token vale uma única vez.
+    """
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('refresh_token'), str):
+        return jsonify({'erro': 'refresh_token é obrigatório'}), 400
+
+    db = get_db()
+    try:
+        conta_id, tipo, refresh_token = rotacionar_refresh_token(db, data['refresh_token'], validade_refresh())
+        db.commit()
+    except RefreshTokenInvalido:
+        # Grava a revogação da família quando o token foi reutilizado
+        db.commit()
+        return jsonify({'erro': 'Refresh token inválido ou expirado'}), 401
+    except Exception as e:
+        db.rollback()
+        current_app.logger.error(f"Erro ao renovar token: {str(e)}")
+        return jsonify({'erro': 'Erro ao renovar token'}), 500
+
+    return jsonify({'token': emitir_token_acesso(conta_id, tipo), 'refresh_token': refresh_token}), 200
@@ -0,0 +1,27 @@
+from flask import Blueprint, jsonify, current_app
+from app.cache import cache_entidades
+from app.autocomplete import autocomplete
+from app.passwords import servico_senhas
+from app.rate_limit import limitador
+from app.auth import cache_tokens, cache_principais
+from app.mailer import enviador_emails
+from app.scheduler import agendador
+from app.db_monitor import monitor_banco
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metricas', methods=['GET'])
+def metricas():
+    """Contadores internos do worker atual"""
+    return jsonify({
+        "cache_entidades": cache_entidades.estatisticas(),
+        "autocomplete": autocomplete.tamanho(),
+        "senhas": servico_senhas.estatisticas(),
+        "limite_tentativas": limitador.estatisticas(),
+        "auth_tokens": cache_tokens.estatisticas(),
+        "auth_principais": cache_principais.estatisticas(),
+        "outbox": enviador_emails.estatisticas(),
+        "agendador": agendador.estatisticas(),
+        "banco": monitor_banco.estatisticas(),
+        "sqlite": current_app.config.get('SQLITE_PERFIL')
+    }), 200
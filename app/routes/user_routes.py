@@ -1,54 +1,53 @@
 from flask import Blueprint, request, jsonify, current_app, url_for
-from app.models.company import Company
 from app.models.user import User, PendingUser, UserDTO
-from app import get_db, mail
-from flask_mail import Message
-from bcrypt import hashpw, gensalt
-from datetime import datetime, timedelta
+from app import get_db
+from app.models.outbox import enfileirar_email
+from app.models.pending import remover_pendentes_expirados
+from app.models.refresh_token import revogar_tokens_da_conta
+from app.passwords import gerar_hash_senha, ServicoSenhasSaturado, resposta_saturado
+from app.serializers import CAMPOS_USUARIO, CAMPOS_VERSAO, colunas, linha_para_dict, linhas_para_dicts
+from app.name_search import buscar_por_nome
+from app.models.identity import resolver_identidade
+from sqlalchemy.exc import IntegrityError
+from app.pagination import ler_limite_busca, ParametroInvalido
+from app.conditional import calcular_etag, resposta_serializada, ultima_modificacao
+from app.cache import cache_entidades
+from app.ids import id_canonico
+from app.rate_limit import limitar_tentativas
 
 user_bp = Blueprint('user', __name__)
 
-def enviar_email(para, assunto, template):
+def enviar_email(db, para, assunto, template):
+    """Grava o e-mail na outbox da transação de db; o envio é feito em segundo plano"""
     try:
-        msg = Message(assunto, recipients=[para], html=template, sender=current_app.config['MAIL_USERNAME'])
-        mail.send(msg)
+        enfileirar_email(db, para, assunto, template)
     except Exception as e:
         current_app.logger.error(f"Erro ao enviar e-mail: {str(e)}")
         raise
 
-def enviar_email_verificacao(user_dto: UserDTO):
+def enviar_email_verificacao(db, user_dto: UserDTO):
     try:
         token = user_dto.to_jwt()
         confirm_url = url_for('user_blueprint.confirmar', token=token, _external=True)
         html = f'<b>Bem-vindo! Por favor, confirme seu e-mail clicando <a href="{confirm_url}">aqui</a>.</b>'
         assunto = "Por favor, confirme seu e-mail"
-        enviar_email(user_dto.email, assunto, html)
+        enviar_email(db, user_dto.email, assunto, html)
     except Exception as e:
         current_app.logger.error(f"Erro ao enviar e-mail de verificação: {str(e)}")
         raise
 
 @user_bp.route('/usuario/registrar', methods=['POST'])
+@limitar_tentativas('registro')
 def registrar():
     try:
         dados = request.get_json()
         if not dados:
             return jsonify({"erro": "Nenhum dado de entrada fornecido"}), 400
 
-        # Verifica se o e-mail já está registrado ou pendente
+        # Verifica se o e-mail já está registrado ou pendente (usuários e empresas)
         db = get_db()
-        
-        existing_user = db.query(User).filter(User.email == dados['email']).first()
-        existing_company = db.query(Company).filter(Company.email == dados['email']).first()
-        
-        
-        
-        if existing_user or existing_company:
-            return jsonify({"erro": "E-mail já registrado ou pendente de confirmação"}), 400
-        
-        
-        existing_pending = db.query(PendingUser).filter(PendingUser.email == dados['email']).first()
-        
-        if existing_user or existing_pending:
+
+        if resolver_identidade(db, dados['email']):
             return jsonify({"erro": "E-mail já registrado ou pendente de confirmação"}), 400
         # Cria um PendingUser temporário
         pending_user = PendingUser(
@@ -57,18 +56,26 @@ def registrar():
             address=dados['address'],
             phone=dados['phone'],
             cpf=dados['cpf'],           
-            password_hash=hashpw(dados['password'].encode('utf-8'), gensalt()).decode('utf-8')
+            password_hash=gerar_hash_senha(dados['password'])
 
         )
 
         db.add(pending_user)
-        db.commit()
 
-        # Envia o e-mail de confirmação
+        # O e-mail de confirmação vai para a outbox no mesmo commit do cadastro
         user_dto = UserDTO(email=pending_user.email)
-        enviar_email_verificacao(user_dto)
+        enviar_email_verificacao(db, user_dto)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Outro cadastro com o mesmo e-mail foi gravado após a verificação
+            db.rollback()
+            return jsonify({"erro": "E-mail já registrado ou pendente de confirmação"}), 400
 
         return jsonify({"mensagem": "Verifique seu e-mail para confirmar a conta."}), 201
+    except ServicoSenhasSaturado:
+        db.rollback()
+        return resposta_saturado()
     except Exception as e:
         db.rollback()
         current_app.logger.error(f"Erro ao registrar usuário: {str(e)}")
@@ -81,7 +88,7 @@ def confirmar(token):
         if not user_dto:
             return jsonify({"erro": "Token inválido ou expirado"}), 400
 
-        db = get_db()
+        db = get_db(leitura=False)  # GET que grava: confirma o cadastro
 
         # Busca o PendingUser correspondente
         #pending_user = PendingUser.query.filter_by(email=user_dto.email).first()
@@ -134,9 +141,11 @@ def redefinir_senha():
         reset_url = url_for('user_blueprint.confirmar_redefinicao', token=token, _external=True)
         html = f'<b>Para redefinir sua senha, clique <a href="{reset_url}">aqui</a>.</b>'
         assunto = "Redefinição de senha"
-        enviar_email(user.email, assunto, html)
+        enviar_email(db, user.email, assunto, html)
+        db.commit()
         return jsonify({"mensagem": "E-mail de redefinição de senha enviado com sucesso."}), 200
     except Exception as e:
+        db.rollback()
         current_app.logger.error(f"Erro ao enviar e-mail de redefinição de senha: {str(e)}")
         return jsonify({"erro": "Erro ao enviar e-mail de redefinição de senha"}), 500
 
@@ -159,14 +168,9 @@ def confirmar_redefinicao(token):
 def limpar_pendentes():
     try:
         db = get_db()
-        # Define o limite de expiração como uma hora atrás
-        limite_expiracao = datetime.utcnow() - timedelta(hours=1)
-        # Remove todos os registros expirados
-        expirados = db.query(PendingUser).filter(PendingUser.expiration < limite_expiracao).all()
-        for pendente in expirados:
-            db.delete(pendente)
-        db.commit()
-        return jsonify({"mensagem": f"{len(expirados)} registros expirados removidos."}), 200
+        # Remove em lotes os registros expirados há mais de uma hora
+        removidos = remover_pendentes_expirados(db, PendingUser)
+        return jsonify({"mensagem": f"{removidos} registros expirados removidos.", "removidos": removidos}), 200
     except Exception as e:
         db.rollback()
         current_app.logger.error(f"Erro ao limpar pending_users: {str(e)}")
@@ -175,17 +179,20 @@ def limpar_pendentes():
 @user_bp.route('/usuario/obter/<id>', methods=['GET'])
 def obter(id):
     try:
-        db = get_db()
-        user = db.query(User).get(id)
-
-        if not user:
+        def carregar():
+            # O cache é preenchido pela principal: uma réplica atrasada o deixaria
+            # com o valor anterior a uma alteração já invalidada, por todo o TTL
+            db = get_db(leitura=False)
+            user = db.query(*colunas(User, CAMPOS_USUARIO + CAMPOS_VERSAO)).filter(User.id == id).first()
+            if not user:
+                return None
+            return linha_para_dict(user, CAMPOS_USUARIO), calcular_etag(tuple(user)), ultima_modificacao([user.updated_at])
+
+        em_cache = cache_entidades.obter_ou_carregar(('usuario', id_canonico(id)), carregar)
+        if not em_cache:
             return jsonify({"erro": "Usuário não encontrado"}), 404
 
-        return jsonify({
-            "id": user.id,
-            "name": user.name,
-            "email": user.email
-        }), 200
+        return resposta_serializada(*em_cache)
     except Exception as e:
         current_app.logger.error(f"Erro ao obter usuário: {str(e)}")
         return jsonify({"erro": "Erro ao obter usuário"}), 500
@@ -194,17 +201,12 @@ def obter(id):
 @user_bp.route('/usuarios/find_by_substring/<substring>', methods=['GET'])
 def find_by_substring(substring):
     try:
+        limite = ler_limite_busca()
         db = get_db()
-        users = db.query(User).filter(User.name.contains(substring)).all()
-        user_list = []
-        for user in users:
-            user_list.append({
-                "id": user.id,
-                "name": user.name,
-                "email": user.email,
-               
-            })
-        return jsonify(user_list), 200
+        users = buscar_por_nome(db, User, substring, CAMPOS_USUARIO, limite)
+        return jsonify(linhas_para_dicts(users, CAMPOS_USUARIO)), 200
+    except ParametroInvalido as e:
+        return jsonify({"erro": str(e)}), 400
     except Exception as e:
         current_app.logger.error(f"Erro ao buscar usuários por substring: {str(e)}")
         return jsonify({"erro": "Erro ao buscar usuários por substring"}), 500
@@ -223,9 +225,14 @@ def nova_senha():
         if not user:
             return jsonify({"erro": "Usuário não encontrado"}), 404
 
-        user.password_hash = hashpw(dados['password'].encode('utf-8'), gensalt()).decode('utf-8')
+        user.password_hash = gerar_hash_senha(dados['password'])
+        # Refresh tokens emitidos com a senha antiga deixam de valer
+        revogar_tokens_da_conta(db, user.id)
         db.commit()
         return jsonify({"mensagem": "Senha alterada com sucesso"}), 200
+    except ServicoSenhasSaturado:
+        db.rollback()
+        return resposta_saturado()
     except Exception as e:
         db.rollback()
         current_app.logger.error(f"Erro ao alterar senha: {str(e)}")
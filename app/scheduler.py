@@ -0,0 +1,80 @@
+# app/scheduler.py
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Agendador:
+    """
+    Executa tarefas de manutenção periódicas (limpezas, otimização do banco)
+    em uma thread do worker. Cada tarefa recebe uma sessão própria e retorna
+    um resultado que fica disponível nas métricas.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tarefas = {}
+        self._thread = None
+        self._criar_sessao = None
+
+    def configurar(self, criar_sessao):
+        self._criar_sessao = criar_sessao
+
+    def registrar(self, nome, intervalo, funcao):
+        """funcao(session) é chamada a cada `intervalo` segundos; intervalo 0 desativa"""
+        with self._lock:
+            self._tarefas[nome] = {
+                'intervalo': intervalo, 'funcao': funcao, 'proxima': time.monotonic() + intervalo,
+                'execucoes': 0, 'erros': 0, 'ultimo_resultado': None, 'ultima_duracao_ms': None
+            }
+
+    def executar(self, nome):
+        """Roda a tarefa agora e retorna o resultado"""
+        tarefa = self._tarefas[nome]
+        session = self._criar_sessao()
+        inicio = time.monotonic()
+        try:
+            resultado = tarefa['funcao'](session)
+        except Exception as e:
+            session.rollback()
+            tarefa['erros'] += 1
+            logger.error(f"Erro na tarefa agendada {nome}: {str(e)}")
+            raise
+        finally:
+            session.close()
+            tarefa['proxima'] = time.monotonic() + tarefa['intervalo']
+        tarefa['execucoes'] += 1
+        tarefa['ultimo_resultado'] = resultado
+        tarefa['ultima_duracao_ms'] = round((time.monotonic() - inicio) * 1000, 2)
+        logger.info(f"Tarefa agendada {nome}: {resultado}")
+        return resultado
+
+    def executar_vencidas(self):
+        agora = time.monotonic()
+        for nome, tarefa in list(self._tarefas.items()):
+            if tarefa['intervalo'] and tarefa['proxima'] <= agora:
+                try:
+                    self.executar(nome)
+                except Exception:
+                    pass
+
+    def iniciar(self, verificacao=1.0):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._executar, args=(verificacao,), name='agendador', daemon=True)
+            self._thread.start()
+
+    def _executar(self, verificacao):
+        while True:
+            time.sleep(verificacao)
+            self.executar_vencidas()
+
+    def estatisticas(self):
+        return {
+            nome: {chave: valor for chave, valor in tarefa.items() if chave not in ('funcao', 'proxima')}
+            for nome, tarefa in self._tarefas.items()
+        }
+
+
+agendador = Agendador()
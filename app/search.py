@@ -0,0 +1,78 @@
+# app/search.py
+from sqlalchemy import DDL, event, inspect, text
+from app.models.exam import Exam
+
+# Índice FTS5 de conteúdo externo sobre exams(title, description).
+# unicode61 com remove_diacritics ignora acentos e caixa ("jose" encontra "José")
+# e os índices de prefixo tornam buscas "term*" tão rápidas quanto termos completos.
+# Como aponta para o rowid de exams, execute reconstruir_indice_busca após um VACUUM.
+DDL_INDICE_BUSCA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS exams_fts USING fts5(
+        title, description,
+        content='exams', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3 4'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS exams_fts_ai AFTER INSERT ON exams BEGIN
+        INSERT INTO exams_fts(rowid, title, description) VALUES (new.rowid, new.title, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS exams_fts_ad AFTER DELETE ON exams BEGIN
+        INSERT INTO exams_fts(exams_fts, rowid, title, description) VALUES ('delete', old.rowid, old.title, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS exams_fts_au AFTER UPDATE OF title, description ON exams BEGIN
+        INSERT INTO exams_fts(exams_fts, rowid, title, description) VALUES ('delete', old.rowid, old.title, old.description);
+        INSERT INTO exams_fts(rowid, title, description) VALUES (new.rowid, new.title, new.description);
+    END""",
+]
+
+# Criado e removido junto com a tabela exams (create_all/drop_all)
+for comando in DDL_INDICE_BUSCA:
+    event.listen(Exam.__table__, 'after_create', DDL(comando).execute_if(dialect='sqlite'))
+event.listen(Exam.__table__, 'before_drop', DDL("DROP TABLE IF EXISTS exams_fts").execute_if(dialect='sqlite'))
+
+
+def criar_indice_busca(bind):
+    """
+    Cria o índice e os triggers em bancos existentes e indexa os exames já
+    gravados quando o índice é novo. Retorna True se o índice foi criado.
+    """
+    if bind.dialect.name != 'sqlite':
+        return False
+    novo = not inspect(bind).has_table('exams_fts')
+    with bind.begin() as conn:
+        for comando in DDL_INDICE_BUSCA:
+            conn.execute(text(comando))
+        if novo:
+            conn.execute(text("INSERT INTO exams_fts(exams_fts) VALUES ('rebuild')"))
+    return novo
+
+
+def reconstruir_indice_busca(session):
+    session.execute(text("INSERT INTO exams_fts(exams_fts) VALUES ('rebuild')"))
+    session.commit()
+
+
+def montar_consulta(termos):
+    """
+    Converte o texto livre em uma consulta FTS5: cada palavra vira um
+    prefixo entre aspas (sem operadores do usuário), todas obrigatórias
+    """
+    palavras = [palavra.replace('"', '""') for palavra in termos.split()]
+    return ' '.join(f'"{palavra}"*' for palavra in palavras if palavra)
+
+
+def pesquisar_exames(session, termos, campos, limite, deslocamento=0):
+    """Exames que casam com os termos, do mais ao menos relevante (bm25)"""
+    consulta = montar_consulta(termos)
+    if not consulta:
+        return []
+    colunas = ', '.join(f'e.{campo}' for campo in campos)
+    sql = text(f"""
+        SELECT {colunas}
+        FROM exams_fts
+        JOIN exams e ON e.rowid = exams_fts.rowid
+        WHERE exams_fts MATCH :consulta
+        ORDER BY exams_fts.rank
+        LIMIT :limite OFFSET :deslocamento
+    """).columns(*(Exam.__table__.c[campo] for campo in campos))  # ids binários voltam como texto
+    return session.execute(sql, {'consulta': consulta, 'limite': limite, 'deslocamento': deslocamento}).all()
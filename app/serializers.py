@@ -0,0 +1,33 @@
+# app/serializers.py
+from datetime import datetime
+from app.models.exam import Exam
+
+# Campos públicos de cada recurso, na ordem em que aparecem nas respostas
+CAMPOS_EXAME = ('id', 'title', 'description', 'company_id', 'user_id')
+CAMPOS_EXAME_EXPORTACAO = CAMPOS_EXAME + ('created_at',)
+CAMPOS_USUARIO = ('id', 'name', 'email')
+CAMPOS_EMPRESA = ('id', 'name', 'address', 'phone', 'cnpj', 'email')
+
+# Campos consultados além dos públicos para os cabeçalhos ETag/Last-Modified
+CAMPOS_VERSAO = ('updated_at',)
+
+
+def colunas(modelo, campos):
+    """Colunas do modelo para uma query projetada (tuplas em vez de objetos ORM)"""
+    return [getattr(modelo, campo) for campo in campos]
+
+
+def colunas_exame(campos=CAMPOS_EXAME):
+    return colunas(Exam, campos)
+
+
+def linha_para_dict(linha, campos):
+    registro = dict(zip(campos, linha))
+    for campo, valor in registro.items():
+        if isinstance(valor, datetime):
+            registro[campo] = valor.isoformat()
+    return registro
+
+
+def linhas_para_dicts(linhas, campos):
+    return [linha_para_dict(linha, campos) for linha in linhas]
@@ -0,0 +1,113 @@
+import unittest
+from sqlalchemy import event
+from app import create_app, drop_test_db
+from app.autocomplete import Autocomplete
+from app.database import Base, fabrica_sessoes_teste, test_engine
+from app.ids import novo_ulid
+from app.models.user import User
+from app.models.company import Company
+from app import TestSession
+
+class AutocompleteRoutesTestCase(unittest.TestCase):
+    def setUp(self):
+        """Configuração executada antes de cada teste"""
+        # Limpar o banco de dados de teste
+        drop_test_db()
+        
+        # Configurar o banco de dados de teste
+        self.db = TestSession()
+        Base.metadata.create_all(bind=self.db.bind)
+        
+        # Registros existentes antes da inicialização do app
+        self.db.add(User(name="José Silva", email="jose@teste.com", password_hash="hash", role=3))
+        self.db.add(Company(
+            name="Silveira Engenharia",
+            address="Rua Empresa, 456",
+            phone="98765432109",
+            cnpj="12345678901234",
+            email="silveira@teste.com",
+            password_hash="hash"
+        ))
+        self.db.commit()
+        
+        # Criar a aplicação de teste (constrói o índice)
+        self.app = create_app(testing=True)
+        
+    def tearDown(self):
+        """Limpeza executada após cada teste"""
+        self.db.close()
+        drop_test_db()
+    
+    def test_autocomplete(self):
+        """Teste das sugestões por prefixo de qualquer palavra do nome"""
+        with self.app.test_client() as client:
+            response = client.get("/api/autocomplete?q=sil")
+            
+            # Verificações
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                [(s["name"], s["tipo"]) for s in response.json],
+                [("José Silva", "usuario"), ("Silveira Engenharia", "empresa")]
+            )
+            
+            # Filtro por tipo e sem acentos
+            response = client.get("/api/autocomplete?q=JOSE&tipo=usuario")
+            self.assertEqual([s["name"] for s in response.json], ["José Silva"])
+            response = client.get("/api/autocomplete?q=sil&tipo=empresa")
+            self.assertEqual([s["name"] for s in response.json], ["Silveira Engenharia"])
+    
+    def test_autocomplete_atualizacao_incremental(self):
+        """Teste da atualização do índice a cada commit"""
+        with self.app.test_client() as client:
+            usuario = User(name="Silvana Costa", email="silvana@teste.com", password_hash="hash", role=3)
+            self.db.add(usuario)
+            self.db.commit()
+            response = client.get("/api/autocomplete?q=silv&tipo=usuario")
+            self.assertEqual([s["name"] for s in response.json], ["José Silva", "Silvana Costa"])
+            
+            # Renomear e excluir
+            usuario.name = "Ana Costa"
+            self.db.commit()
+            response = client.get("/api/autocomplete?q=ana")
+            self.assertEqual([s["name"] for s in response.json], ["Ana Costa"])
+            self.db.delete(usuario)
+            self.db.commit()
+            response = client.get("/api/autocomplete?q=costa")
+            self.assertEqual(response.json, [])
+            
+            # Alterações desfeitas não entram no índice
+            self.db.add(User(name="Rollback", email="rollback@teste.com", password_hash="hash", role=3))
+            self.db.flush()
+            self.db.rollback()
+            self.assertEqual(client.get("/api/autocomplete?q=rollback").json, [])
+    
+    def test_recarga_nao_perde_gravacoes_concorrentes(self):
+        """Gravações feitas durante a recarga sobrevivem à troca do índice"""
+        indice = Autocomplete()
+        jose_id = self.db.query(User.id).filter_by(email="jose@teste.com").scalar()
+        self.db.commit()
+        
+        def gravar_durante_a_carga(session):
+            # Outro worker insere depois da carga; este processo renomeia antes da troca
+            with test_engine.begin() as conn:
+                conn.execute(User.__table__.insert().values(
+                    id=novo_ulid(), name="Silvio Santos", email="silvio@teste.com", password_hash="hash", role=3
+                ))
+            indice.aplicar([("usuario", jose_id, "José Silveira")])
+        
+        def criar_sessao():
+            session = fabrica_sessoes_teste()
+            event.listen(session, 'after_commit', gravar_durante_a_carga, once=True)
+            return session
+        
+        indice.construir(criar_sessao, recarga=0)
+        self.assertEqual([s["name"] for s in indice.buscar("sil", 10, "usuario")], ["José Silveira", "Silvio Santos"])
+    
+    def test_autocomplete_parametros_invalidos(self):
+        """Teste de parâmetros inválidos"""
+        with self.app.test_client() as client:
+            self.assertEqual(client.get("/api/autocomplete").status_code, 400)
+            self.assertEqual(client.get("/api/autocomplete?q=a&tipo=exame").status_code, 400)
+
+if __name__ == "__main__":
+    unittest.main()
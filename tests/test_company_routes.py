@@ -7,10 +7,16 @@ from app import create_app, drop_test_db
 from app.database import Base
 from app.models.company import Company, PendingCompany, CompanyDTO
 from app import TestSession
+from app.rate_limit import limitador, arquivo_limites
+from app.models.identity import IdentityKind
+from app.models.refresh_token import RefreshToken, emitir_refresh_token
 
 class CompanyRoutesTestCase(unittest.TestCase):
     def setUp(self):
         """Configuração executada antes de cada teste"""
+        # Baldes do limitador cheios, no arquivo de testes deste processo
+        limitador.configurar(arquivo_limites(testing=True))
+        limitador.limpar(agora=float('inf'))
         # Limpar o banco de dados de teste
         drop_test_db()
         
@@ -276,6 +282,39 @@ class CompanyRoutesTestCase(unittest.TestCase):
             self.assertEqual(data["name"], "Empresa de Teste")
             self.assertEqual(data["email"], "empresa@teste.com")
     
+    @patch('app.routes.company_routes.get_db')
+    def test_obter_empresa_condicional(self, mock_get_db):
+        """Teste de GET condicional (ETag) ao obter empresa"""
+        # Configurar o mock para retornar o banco de dados de teste
+        mock_get_db.return_value = self.db
+        
+        empresa = Company(
+            name="Empresa Condicional",
+            address="Rua de Teste, 123",
+            phone="33333333333",
+            cnpj="44444444444444",
+            email="condicional@teste.com",
+            password_hash=hashpw("senha123".encode('utf-8'), gensalt()).decode('utf-8')
+        )
+        self.db.add(empresa)
+        self.db.commit()
+        
+        # Criar a aplicação de teste
+        self.app = create_app(testing=True)
+        
+        with self.app.test_client() as client:
+            response = client.get(f"/api/empresa/obter/{empresa.id}")
+            etag = response.headers["ETag"]
+            
+            response = client.get(f"/api/empresa/obter/{empresa.id}", headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            
+            empresa.phone = "55555555555"
+            self.db.commit()
+            response = client.get(f"/api/empresa/obter/{empresa.id}", headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json["phone"], "55555555555")
+    
     @patch('app.routes.company_routes.get_db')
     def test_find_by_substring(self, mock_get_db):
         """Teste para buscar empresas por substring no nome"""
@@ -351,6 +390,11 @@ class CompanyRoutesTestCase(unittest.TestCase):
         
         self.db.add(empresa)
         self.db.commit()
+
+        # Duas sessões abertas com a senha antiga (famílias distintas)
+        for _ in range(2):
+            emitir_refresh_token(self.db, empresa.id, IdentityKind.EMPRESA)
+        self.db.commit()
         
         # Criar a aplicação de teste
         self.app = create_app(testing=True)
@@ -381,5 +425,10 @@ class CompanyRoutesTestCase(unittest.TestCase):
                 checkpw(senha_original.encode('utf-8'), empresa_atualizada.password_hash.encode('utf-8'))
             )
 
+            # Os refresh tokens da senha antiga foram revogados
+            self.db.expire_all()
+            self.assertEqual(self.db.query(RefreshToken).filter(RefreshToken.revoked_at.is_(None)).count(), 0)
+            self.assertEqual(self.db.query(RefreshToken).count(), 2)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -7,7 +7,10 @@ from app.database import Base
 from app.models.exam import Exam
 from app.models.user import User
 from app.models.company import Company
-from app import TestSession
+from app import TestSession, test_engine
+from app.database import criar_indices_ausentes, init_db
+from app.models.exam_stats import ExamCompanyDaily, ExamUserMonthly, reconstruir_agregados
+from sqlalchemy import inspect, text
 from bcrypt import hashpw, gensalt
 
 class ExamRoutesTestCase(unittest.TestCase):
@@ -115,6 +118,87 @@ class ExamRoutesTestCase(unittest.TestCase):
             self.assertEqual(response.json["id"], str(exame.id))
             self.assertEqual(response.json["title"], "Radiografia")
     
+    @patch('app.routes.exam_routes.get_db')
+    def test_obter_e_listar_condicional(self, mock_get_db):
+        """Teste de GET condicional em obter e nas listagens de exames"""
+        # Configurar o mock para retornar o banco de dados de teste
+        mock_get_db.return_value = self.db
+        
+        exame = Exam(
+            user_id=self.test_user.id,
+            company_id=self.test_company.id,
+            title="Radiografia"
+        )
+        self.db.add(exame)
+        self.db.commit()
+        
+        # Criar a aplicação de teste
+        self.app = create_app(testing=True)
+        
+        with self.app.test_client() as client:
+            for url in (f"/api/exames/obter/{exame.id}", f"/api/exames/listar_por_empresa/{self.test_company.id}"):
+                etag = client.get(url).headers["ETag"]
+                response = client.get(url, headers={"If-None-Match": etag})
+                self.assertEqual(response.status_code, 304)
+            
+            # Um novo exame altera o ETag da listagem
+            self.db.add(Exam(
+                user_id=self.test_user.id,
+                company_id=self.test_company.id,
+                title="Outro Exame"
+            ))
+            self.db.commit()
+            response = client.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json["exames"]), 2)
+            
+            # Excluir o exame mais recente não muda o maior updated_at: a listagem
+            # não envia Last-Modified, então If-Modified-Since não gera um 304 falso
+            self.assertNotIn("Last-Modified", response.headers)
+            self.db.query(Exam).filter(Exam.title == "Outro Exame").delete()
+            self.db.commit()
+            response = client.get(url, headers={"If-Modified-Since": "Fri, 31 Dec 2100 00:00:00 GMT"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json["exames"]), 1)
+    
+    @patch('app.routes.exam_routes.get_db')
+    def test_obter_exame_em_cache(self, mock_get_db):
+        """Teste do cache de obter e da invalidação ao atualizar"""
+        # Configurar o mock para retornar o banco de dados de teste
+        mock_get_db.return_value = self.db
+        
+        exame = Exam(
+            user_id=self.test_user.id,
+            company_id=self.test_company.id,
+            title="Radiografia"
+        )
+        self.db.add(exame)
+        self.db.commit()
+        
+        # Criar a aplicação de teste
+        self.app = create_app(testing=True)
+        
+        with self.app.test_client() as client:
+            client.get(f"/api/exames/obter/{exame.id}")
+            chamadas = mock_get_db.call_count
+            # O cache é preenchido a partir da sessão principal
+            mock_get_db.assert_called_with(leitura=False)
+            
+            # Segunda leitura vem do cache, sem acessar o banco, mesmo com o id em minúsculas
+            response = client.get(f"/api/exames/obter/{exame.id.lower()}")
+            self.assertEqual(response.json["title"], "Radiografia")
+            self.assertEqual(mock_get_db.call_count, chamadas)
+            self.assertEqual(client.get("/api/metricas").json["cache_entidades"]["hits"], 1)
+            
+            # Alteração invalida a entrada, qualquer que seja a grafia do id usada na leitura
+            client.put(
+                f"/api/exames/atualizar/{exame.id}",
+                data=json.dumps({"title": "Tomografia"}),
+                content_type="application/json"
+            )
+            response = client.get(f"/api/exames/obter/{exame.id.lower()}")
+            self.assertEqual(response.json["title"], "Tomografia")
+    
     @patch('app.routes.exam_routes.get_db')
     def test_atualizar_exame(self, mock_get_db):
         """Teste para atualizar um exame"""
@@ -214,9 +298,61 @@ class ExamRoutesTestCase(unittest.TestCase):
             
             # Verificações
             self.assertEqual(response.status_code, 200)
-            exames = response.json
+            exames = response.json["exames"]
             self.assertEqual(len(exames), 3)
     
+    @patch('app.routes.exam_routes.get_db')
+    def test_listar_exames_paginado(self, mock_get_db):
+        """Teste da paginação por cursor na listagem de exames"""
+        # Configurar o mock para retornar o banco de dados de teste
+        mock_get_db.return_value = self.db
+        
+        # Adicionar exames com ids ordenados
+        ids = []
+        for i in range(5):
+            exame = Exam(
+                id=f"01J0000000000000000000000{i}",
+                user_id=self.test_user.id,
+                company_id=self.test_company.id,
+                title=f"Exame {i+1}"
+            )
+            self.db.add(exame)
+            ids.append(exame.id)
+        self.db.commit()
+        
+        # Criar a aplicação de teste
+        self.app = create_app(testing=True)
+        
+        with self.app.test_client() as client:
+            # Primeira página
+            response = client.get("/api/exames/listar?limit=2")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([e["id"] for e in response.json["exames"]], ids[:2])
+            self.assertEqual(response.json["next_cursor"], ids[1])
+            self.assertIsNone(response.json["prev_cursor"])
+            
+            # Segunda página a partir do cursor
+            response = client.get(f"/api/exames/listar?limit=2&after={ids[1]}")
+            self.assertEqual([e["id"] for e in response.json["exames"]], ids[2:4])
+            self.assertEqual(response.json["prev_cursor"], ids[2])
+            
+            # Última página não tem próximo cursor
+            response = client.get(f"/api/exames/listar?limit=2&after={ids[3]}")
+            self.assertEqual([e["id"] for e in response.json["exames"]], ids[4:])
+            self.assertIsNone(response.json["next_cursor"])
+            
+            # Voltando a partir do cursor before
+            response = client.get(f"/api/exames/listar?limit=2&before={ids[4]}")
+            self.assertEqual([e["id"] for e in response.json["exames"]], ids[2:4])
+            self.assertEqual(response.json["prev_cursor"], ids[2])
+            self.assertEqual(response.json["next_cursor"], ids[3])
+            
+            # Parâmetros inválidos
+            response = client.get("/api/exames/listar?limit=0")
+            self.assertEqual(response.status_code, 400)
+            response = client.get(f"/api/exames/listar?after={ids[0]}&before={ids[4]}")
+            self.assertEqual(response.status_code, 400)
+    
     @patch('app.routes.exam_routes.get_db')
     def test_listar_por_usuario(self, mock_get_db):
         """Teste para listar exames por usuário"""
@@ -264,7 +400,7 @@ class ExamRoutesTestCase(unittest.TestCase):
             
             # Verificações
             self.assertEqual(response.status_code, 200)
-            exames = response.json
+            exames = response.json["exames"]
             self.assertEqual(len(exames), 1)
             self.assertEqual(exames[0]["title"], "Exame Usuário 1")
     
@@ -314,7 +450,7 @@ class ExamRoutesTestCase(unittest.TestCase):
             
             # Verificações
             self.assertEqual(response.status_code, 200)
-            exames = response.json
+            exames = response.json["exames"]
             self.assertEqual(len(exames), 1)
             self.assertEqual(exames[0]["title"], "Exame Empresa 1")
     
@@ -428,5 +564,322 @@ class ExamRoutesTestCase(unittest.TestCase):
             # Verificações
             self.assertEqual(response.status_code, 200)
 
+    @patch('app.routes.exam_routes.get_db')
+    def test_buscar_exames(self, mock_get_db):
+        """Teste da busca combinando empresa, usuário, intervalo de datas e título"""
+        # Configurar o mock para retornar o banco de dados de teste
+        mock_get_db.return_value = self.db
+        
+        # Adicionar exames em datas diferentes
+        self.db.add(Exam(
+            user_id=self.test_user.id,
+            company_id=self.test_company.id,
+            title="Audiometria",
+            created_at=datetime(2024, 3, 10, 14, 30)
+        ))
+        self.db.add(Exam(
+            user_id=self.test_user.id,
+            company_id=self.test_company.id,
+            title="Espirometria",
+            created_at=datetime(2024, 3, 31, 23, 59)
+        ))
+        self.db.add(Exam(
+            user_id=self.test_user.id,
+            company_id=self.test_company.id,
+            title="Audiometria",
+            created_at=datetime(2024, 4, 1, 8, 0)
+        ))
+        self.db.commit()
+        
+        # Criar a aplicação de teste
+        self.app = create_app(testing=True)
+        
+        with self.app.test_client() as client:
+            # Um mês de exames da empresa, incluindo o último dia inteiro
+            response = client.get(
+                f"/api/exames/buscar?company_id={self.test_company.id}&from=2024-03-01&to=2024-03-31"
+            )
+            self.assertEqual(response.status_code, 200)
+            titulos = sorted(e["title"] for e in response.json["exames"])
+            self.assertEqual(titulos, ["Audiometria", "Espirometria"])
+            
+            # Filtro por título combinado com usuário
+            response = client.get(f"/api/exames/buscar?user_id={self.test_user.id}&title=Audiometria")
+            self.assertEqual(len(response.json["exames"]), 2)
+            
+            # Rota legada por data agora compara o dia inteiro
+            response = client.get(f"/api/exames/listar_por_data_empresa/2024-04-01/{self.test_company.id}")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json["exames"]), 1)
+            
+            # Timestamp com fuso é comparado em UTC: 10h em +03:00 são 7h UTC, antes do exame das 8h
+            response = client.get("/api/exames/buscar?from=2024-04-01T10:00:00%2B03:00")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([e["title"] for e in response.json["exames"]], ["Audiometria"])
+            
+            # Datas inválidas
+            response = client.get("/api/exames/buscar?from=01/03/2024")
+            self.assertEqual(response.status_code, 400)
+            response = client.get("/api/exames/buscar?from=2024-04-01&to=2024-03-01")
+            self.assertEqual(response.status_code, 400)
+
+    @patch('app.routes.exam_routes.get_db')
+    def test_exportar_exames(self, mock_get_db):
+        """Teste da exportação em NDJSON e CSV"""
+        # Configurar o mock para retornar o banco de dados de teste
+        mock_get_db.return_value = self.db
+        
+        # Adicionar alguns exames
+        for i in range(3):
+            self.db.add(Exam(
+                user_id=self.test_user.id,
+                company_id=self.test_company.id,
+                title=f"Exame {i+1}",
+                description="Descrição, com vírgula"
+            ))
+        self.db.commit()
+        
+        # Criar a aplicação de teste
+        self.app = create_app(testing=True)
+        
+        with self.app.test_client() as client:
+            # Exportação NDJSON com filtro
+            response = client.get(f"/api/exames/exportar?company_id={self.test_company.id}")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, "application/x-ndjson")
+            linhas = [json.loads(l) for l in response.get_data(as_text=True).splitlines()]
+            self.assertEqual(sorted(l["title"] for l in linhas), ["Exame 1", "Exame 2", "Exame 3"])
+            
+            # Exportação CSV com cabeçalho
+            response = client.get("/api/exames/exportar?formato=csv")
+            self.assertEqual(response.status_code, 200)
+            linhas = response.get_data(as_text=True).splitlines()
+            self.assertEqual(linhas[0], "id,title,description,company_id,user_id,created_at")
+            self.assertEqual(len(linhas), 4)
+            self.assertIn('"Descrição, com vírgula"', linhas[1])
+            
+            # Formato inválido
+            response = client.get("/api/exames/exportar?formato=xml")
+            self.assertEqual(response.status_code, 400)
+
+            # Falha no meio do cursor: a resposta é abortada em vez de terminar truncada
+            from app.routes.exam_routes import linha_para_dict
+            lidas = []
+            def falhar_apos_duas(linha, campos):
+                lidas.append(linha)
+                if len(lidas) > 2:
+                    raise RuntimeError("conexão perdida")
+                return linha_para_dict(linha, campos)
+            with patch('app.routes.exam_routes.linha_para_dict', side_effect=falhar_apos_duas):
+                response = client.get("/api/exames/exportar")
+                self.assertEqual(response.status_code, 200)
+                with self.assertRaises(RuntimeError):
+                    response.get_data()
+    
+    @patch('app.routes.exam_routes.get_db')
+    def test_importar_exames(self, mock_get_db):
+        """Teste da importação em massa via NDJSON"""
+        # Configurar o mock para retornar o banco de dados de teste
+        mock_get_db.return_value = self.db
+        
+        # Criar a aplicação de teste
+        self.app = create_app(testing=True)
+        
+        linhas = [
+            json.dumps({"title": f"Exame {i}", "user_id": self.test_user.id, "company_id": self.test_company.id})
+            for i in range(5)
+        ]
+        linhas.insert(2, '{"title": "Sem empresa"}')
+        linhas.insert(4, 'isto não é json')
+        linhas.insert(5, json.dumps({"title": 123, "user_id": self.test_user.id, "company_id": self.test_company.id}))
+        linhas.insert(6, json.dumps({"title": "Empresa objeto", "user_id": self.test_user.id, "company_id": {"a": 1}}))
+        
+        with self.app.test_client() as client:
+            response = client.post(
+                "/api/exames/importar?lote=2",
+                data="\n".join(linhas) + "\n",
+                content_type="application/x-ndjson"
+            )
+            
+            # Verificações
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json["inseridos"], 5)
+            self.assertEqual([e["linha"] for e in response.json["erros"]], [3, 5, 6, 7])
+            self.assertEqual(response.json["erros"][2]["erro"], "Campo title deve ser texto")
+            self.assertEqual(response.json["total_erros"], 4)
+            self.assertEqual(self.db.query(Exam).count(), 5)
+            
+            # Só os primeiros erros são detalhados; o total conta todos
+            self.app.config['IMPORTACAO_ERROS_MAXIMO'] = 2
+            response = client.post("/api/exames/importar", data="x\n" * 10, content_type="application/x-ndjson")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([e["linha"] for e in response.json["erros"]], [1, 2])
+            self.assertEqual(response.json["total_erros"], 10)
+            
+            # Corpo vazio
+            response = client.post("/api/exames/importar", data="", content_type="application/x-ndjson")
+            self.assertEqual(response.status_code, 400)
+    
+    @patch('app.routes.exam_routes.get_db')
+    def test_estatisticas(self, mock_get_db):
+        """Teste dos agregados mantidos em criar, atualizar, deletar e importar"""
+        # Configurar o mock para retornar o banco de dados de teste
+        mock_get_db.return_value = self.db
+        
+        # Exames em dias e meses diferentes
+        antigo = Exam(
+            user_id=self.test_user.id,
+            company_id=self.test_company.id,
+            title="Exame Antigo",
+            created_at=datetime(2024, 2, 20, 10, 0)
+        )
+        self.db.add(antigo)
+        self.db.add(Exam(
+            user_id=self.test_user.id,
+            company_id=self.test_company.id,
+            title="Exame Março",
+            created_at=datetime(2024, 3, 5, 10, 0)
+        ))
+        self.db.commit()
+        hoje = datetime.utcnow()
+        
+        # Criar a aplicação de teste
+        self.app = create_app(testing=True)
+        
+        with self.app.test_client() as client:
+            response = client.post(
+                "/api/exames/criar",
+                data=json.dumps({"title": "Novo", "user_id": self.test_user.id, "company_id": self.test_company.id}),
+                content_type="application/json"
+            )
+            novo_id = response.json["id"]
+            client.post(
+                "/api/exames/importar",
+                data=json.dumps({"title": "Importado", "user_id": self.test_user.id, "company_id": self.test_company.id}),
+                content_type="application/x-ndjson"
+            )
+            
+            # Mover um exame para outra empresa e excluir outro
+            client.put(
+                f"/api/exames/atualizar/{novo_id}",
+                data=json.dumps({"company_id": "OUTRA"}),
+                content_type="application/json"
+            )
+            client.delete(f"/api/exames/deletar/{antigo.id}")
+            
+            response = client.get(f"/api/exames/estatisticas?company_id={self.test_company.id}")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json["dias"], [
+                {"dia": "2024-03-05", "total": 1},
+                {"dia": hoje.strftime("%Y-%m-%d"), "total": 1}
+            ])
+            
+            response = client.get(f"/api/exames/estatisticas?company_id=OUTRA&from={hoje.strftime('%Y-%m-%d')}")
+            self.assertEqual(response.json["total"], 1)
+            
+            response = client.get(f"/api/exames/estatisticas?user_id={self.test_user.id}&from=2024-01&to=2024-12")
+            self.assertEqual(response.json["meses"], [{"mes": "2024-03", "total": 1}])
+            
+            # Parâmetros inválidos
+            self.assertEqual(client.get("/api/exames/estatisticas").status_code, 400)
+            response = client.get(f"/api/exames/estatisticas?user_id={self.test_user.id}&from=2024-01-01")
+            self.assertEqual(response.status_code, 400)
+        
+        # A reconstrução produz os mesmos totais
+        antes = sorted((a.company_id, a.day, a.total) for a in self.db.query(ExamCompanyDaily) if a.total)
+        self.assertEqual(reconstruir_agregados(self.db), 3)
+        depois = sorted((a.company_id, a.day, a.total) for a in self.db.query(ExamCompanyDaily))
+        self.assertEqual(antes, depois)
+    
+    def test_agregados_preenchidos_em_banco_existente(self):
+        """init_db preenche os agregados de um banco que já tinha exames e não tinha as tabelas"""
+        self.db.add_all([
+            Exam(user_id=self.test_user.id, company_id=self.test_company.id, title="Antigo",
+                 created_at=datetime(2024, 3, 5, 10, 0)),
+            Exam(user_id=self.test_user.id, company_id=self.test_company.id, title="Antigo 2",
+                 created_at=datetime(2024, 3, 5, 15, 0))
+        ])
+        self.db.commit()
+        self.db.close()
+        ExamCompanyDaily.__table__.drop(bind=test_engine)
+        ExamUserMonthly.__table__.drop(bind=test_engine)
+        
+        init_db(test_engine)
+        init_db(test_engine)  # Agregados já preenchidos: nada é somado de novo
+        self.assertEqual([(a.day, a.total) for a in self.db.query(ExamCompanyDaily)], [("2024-03-05", 2)])
+        self.assertEqual([(a.month, a.total) for a in self.db.query(ExamUserMonthly)], [("2024-03", 2)])
+    
+    @patch('app.routes.exam_routes.get_db')
+    def test_pesquisar_exames(self, mock_get_db):
+        """Teste da pesquisa textual com prefixos e sem acentos"""
+        # Configurar o mock para retornar o banco de dados de teste
+        mock_get_db.return_value = self.db
+        
+        self.db.add(Exam(
+            user_id=self.test_user.id,
+            company_id=self.test_company.id,
+            title="Audiometria ocupacional",
+            description="Avaliação auditiva periódica"
+        ))
+        exame = Exam(
+            user_id=self.test_user.id,
+            company_id=self.test_company.id,
+            title="Hemograma",
+            description="Análise de sangue"
+        )
+        self.db.add(exame)
+        self.db.commit()
+        
+        # Criar a aplicação de teste
+        self.app = create_app(testing=True)
+        
+        with self.app.test_client() as client:
+            response = client.get("/api/exames/pesquisar?q=avaliacao audi")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([e["title"] for e in response.json["exames"]], ["Audiometria ocupacional"])
+            
+            response = client.get("/api/exames/pesquisar?q=ANALISE")
+            self.assertEqual([e["title"] for e in response.json["exames"]], ["Hemograma"])
+            
+            # O índice acompanha alterações e exclusões
+            client.put(
+                f"/api/exames/atualizar/{exame.id}",
+                data=json.dumps({"title": "Glicemia", "description": "Jejum"}),
+                content_type="application/json"
+            )
+            self.assertEqual(client.get("/api/exames/pesquisar?q=analise").json["exames"], [])
+            self.assertEqual(len(client.get("/api/exames/pesquisar?q=glic").json["exames"]), 1)
+            client.delete(f"/api/exames/deletar/{exame.id}")
+            self.assertEqual(client.get("/api/exames/pesquisar?q=glic").json["exames"], [])
+            
+            # Consulta ausente
+            self.assertEqual(client.get("/api/exames/pesquisar").status_code, 400)
+    
+    def test_criar_indices_em_banco_existente(self):
+        """Teste da criação dos índices compostos em um banco já existente"""
+        exame = Exam(
+            user_id=self.test_user.id,
+            company_id=self.test_company.id,
+            title="Exame Existente"
+        )
+        self.db.add(exame)
+        self.db.commit()
+        self.db.close()
+        
+        # Simular um banco criado antes dos índices
+        with test_engine.begin() as conn:
+            conn.execute(text("DROP INDEX ix_exams_company_id_created_at"))
+            conn.execute(text("DROP INDEX ix_exams_user_id_created_at"))
+        
+        criados = criar_indices_ausentes(test_engine)
+        
+        self.assertEqual(sorted(criados), ["ix_exams_company_id_created_at", "ix_exams_user_id_created_at"])
+        nomes = {i["name"] for i in inspect(test_engine).get_indexes("exams")}
+        self.assertIn("ix_exams_company_id_created_at", nomes)
+        self.assertEqual(self.db.query(Exam).count(), 1)
+        
+        # Executar novamente não cria nada
+        self.assertEqual(criar_indices_ausentes(test_engine), [])
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,89 @@
+import unittest
+import tempfile
+from unittest.mock import patch
+from sqlalchemy import Column, MetaData, String, Table, text
+from app import drop_test_db
+from app.database import Base, TestSession, criar_engine
+from app.ids import GeradorULID, ULIDBinario, migrar_ids_binarios, novo_ulid, ulid_binario
+from app.models.user import User
+from app.models.exam import Exam
+
+
+class IdsTestCase(unittest.TestCase):
+    def setUp(self):
+        """Configuração executada antes de cada teste"""
+        drop_test_db()
+        self.db = TestSession()
+        Base.metadata.create_all(bind=self.db.bind)
+
+    def tearDown(self):
+        """Limpeza executada após cada teste"""
+        self.db.close()
+        drop_test_db()
+
+    def test_monotonico_no_mesmo_milissegundo(self):
+        """Ids do mesmo milissegundo (ou com o relógio voltando) são crescentes"""
+        gerador = GeradorULID()
+        with patch('app.ids.time.time_ns', side_effect=[5_000_000] * 3 + [4_000_000, 6_000_000]):
+            ids = [gerador.novo() for _ in range(5)]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), 5)
+        self.assertEqual(len({i[:10] for i in ids[:4]}), 1)  # mesmo timestamp
+        self.assertEqual(int.from_bytes(ulid_binario(ids[1]), 'big') - int.from_bytes(ulid_binario(ids[0]), 'big'), 1)
+
+        ids = [novo_ulid() for _ in range(1000)]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), 1000)
+
+    def test_gravado_em_16_bytes(self):
+        """O banco guarda 16 bytes; a aplicação continua vendo o texto de 26 caracteres"""
+        usuario = User(name="Usuário Binário", email="binario@teste.com", password_hash="x", cpf="44444444444")
+        self.db.add(usuario)
+        self.db.flush()
+        self.db.add(Exam(title="Exame", user_id=usuario.id))
+        self.db.commit()
+        id = usuario.id
+
+        self.assertEqual(len(id), 26)
+        self.assertEqual(self.db.execute(text("SELECT typeof(id), length(id) FROM users")).one(), ('blob', 16))
+        self.db.expire_all()
+        self.assertEqual(self.db.get(User, id).id, id)
+        self.assertEqual(self.db.query(Exam).filter_by(user_id=id).one().user_id, id)
+        self.assertEqual(self.db.query(Exam).filter(Exam.user_id == id.lower()).count(), 1)
+
+    def test_id_que_nao_e_ulid(self):
+        """Ids antigos que não são ULID continuam texto e são encontrados pelo mesmo valor"""
+        self.db.add(User(id="123e4567-e89b-12d3-a456-426614174000", name="Antigo",
+                         email="antigo@teste.com", password_hash="x", cpf="55555555555"))
+        self.db.commit()
+        self.db.expire_all()
+        self.assertEqual(self.db.get(User, "123e4567-e89b-12d3-a456-426614174000").name, "Antigo")
+        self.assertEqual(self.db.execute(text("SELECT typeof(id) FROM users")).scalar(), 'text')
+
+    def test_migracao_de_ids_texto(self):
+        """Bancos antigos têm os ULIDs em texto convertidos uma única vez, sem recriar tabelas"""
+        with tempfile.TemporaryDirectory() as pasta:
+            engine = criar_engine(f'sqlite:///{pasta}/antigo.db')
+            with engine.begin() as conn:
+                conn.exec_driver_sql('CREATE TABLE itens (id VARCHAR(26) PRIMARY KEY, dono_id VARCHAR(26), nome VARCHAR)')
+                conn.exec_driver_sql('INSERT INTO itens VALUES (?, ?, ?)', [
+                    (novo_ulid(), novo_ulid(), 'ulid'),
+                    ('legado-1', None, 'legado'),
+                ])
+            metadata = MetaData()
+            Table('itens', metadata, Column('id', ULIDBinario, primary_key=True),
+                  Column('dono_id', ULIDBinario), Column('nome', String))
+
+            with self.assertLogs('app.ids', 'WARNING') as logs:
+                self.assertEqual(migrar_ids_binarios(engine, metadata), {'itens.id': 1, 'itens.dono_id': 1})
+            self.assertEqual(len(logs.output), 2)
+            self.assertIn('1 valores convertidos em itens.id', logs.output[0])
+            self.assertEqual(migrar_ids_binarios(engine, metadata), {})
+            with engine.connect() as conn:
+                tipos = dict(conn.exec_driver_sql('SELECT nome, typeof(id) FROM itens').all())
+            self.assertEqual(tipos, {'ulid': 'blob', 'legado': 'text'})
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    unittest.main()
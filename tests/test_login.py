@@ -1,16 +1,26 @@
 import unittest
 import json
+import threading
+import time
 from flask import Flask, g
 from bcrypt import hashpw, gensalt
 from unittest.mock import patch
 from app import create_app, drop_test_db
 from app.database import Base, get_db
 from app.models.user import User
+from app.models.company import Company
 from app import TestSession
+from app.passwords import servico_senhas, custo_do_hash, calibrar_custo, ServicoSenhasSaturado
+from app.rate_limit import limitador, arquivo_limites
+from app.models.refresh_token import RefreshToken, emitir_refresh_token, remover_refresh_expirados
+from datetime import timedelta
 
 class LoginTestCase(unittest.TestCase):
     def setUp(self):
         """Configuração executada antes de cada teste"""
+        # Baldes do limitador cheios, no arquivo de testes deste processo
+        limitador.configurar(arquivo_limites(testing=True))
+        limitador.limpar(agora=float('inf'))
         # Limpar o banco de dados de teste
         drop_test_db()
         
@@ -62,6 +72,37 @@ class LoginTestCase(unittest.TestCase):
             data = json.loads(response.data)
             self.assertIn("token", data)
     
+    @patch('app.routes.login.get_db')
+    def test_login_empresa(self, mock_get_db):
+        """Teste de login de empresa, com e-mail em outra caixa"""
+        # Configurar o mock para retornar o banco de dados de teste
+        mock_get_db.return_value = self.db
+        
+        empresa = Company(
+            name="Empresa Teste",
+            address="Rua Empresa, 456",
+            phone="98765432109",
+            cnpj="12345678901234",
+            email="empresa@email.com",
+            password_hash=hashpw("abcdef".encode("utf-8"), gensalt()).decode("utf-8")
+        )
+        self.db.add(empresa)
+        self.db.commit()
+        
+        # Criar a aplicação de teste depois de configurar o mock
+        self.app = create_app(testing=True)
+        
+        with self.app.test_client() as client:
+            response = client.post(
+                "/api/login",
+                data=json.dumps({"email": "Empresa@Email.com", "password": "abcdef"}),
+                content_type="application/json",
+            )
+            
+            # Verificar se o status code é 200 (OK)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("token", json.loads(response.data))
+    
     @patch('app.routes.login.get_db')
     def test_login_wrong_password(self, mock_get_db):
         """Teste de login com senha incorreta"""
@@ -100,5 +141,214 @@ class LoginTestCase(unittest.TestCase):
             # Verificar se o status code é 404 (Not Found)
             self.assertEqual(response.status_code, 404)
 
+    @patch('app.routes.login.get_db')
+    def test_login_servico_senhas_saturado(self, mock_get_db):
+        """Com o pool do bcrypt ocupado e sem fila, o login responde 503 sem esperar"""
+        mock_get_db.return_value = self.db
+        self.app = create_app(testing=True)
+        servico_senhas.configurar(trabalhadores=1, fila_maxima=0)
+
+        liberar = threading.Event()
+        ocupante = threading.Thread(target=servico_senhas._executar, args=(liberar.wait,))
+        ocupante.start()
+        while servico_senhas.estatisticas()["pendentes"] < 1:
+            time.sleep(0.01)
+        try:
+            with self.app.test_client() as client:
+                response = client.post(
+                    "/api/login",
+                    data=json.dumps({"email": "user@email.com", "password": "123456"}),
+                    content_type="application/json",
+                )
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response.headers.get("Retry-After"), "1")
+        finally:
+            liberar.set()
+            ocupante.join()
+
+        estatisticas = servico_senhas.estatisticas()
+        self.assertEqual(estatisticas["rejeitados"], 1)
+        self.assertEqual(estatisticas["pendentes"], 0)
+        self.assertEqual(estatisticas["concluidos"], 1)
+
+    def test_tempo_esgotado_cancela_tarefa_na_fila(self):
+        """Esgotada a espera, a tarefa ainda na fila é cancelada e não roda depois"""
+        servico_senhas.configurar(trabalhadores=1, fila_maxima=1, espera_maxima=0.05)
+        liberar = threading.Event()
+
+        def ocupar():
+            # Quem ocupa o worker também desiste após espera_maxima, mas sua tarefa já está rodando
+            with self.assertRaises(ServicoSenhasSaturado):
+                servico_senhas._executar(liberar.wait)
+
+        ocupante = threading.Thread(target=ocupar)
+        ocupante.start()
+        while servico_senhas.estatisticas()["pendentes"] < 1:
+            time.sleep(0.01)
+
+        executadas = []
+        try:
+            with self.assertRaises(ServicoSenhasSaturado):
+                servico_senhas._executar(executadas.append, 'atrasada')
+            self.assertEqual(servico_senhas.estatisticas()["pendentes"], 1)
+        finally:
+            liberar.set()
+            ocupante.join()
+        servico_senhas._executor.shutdown(wait=True)
+
+        estatisticas = servico_senhas.estatisticas()
+        self.assertEqual(executadas, [])
+        self.assertEqual(estatisticas["rejeitados"], 2)
+        self.assertEqual(estatisticas["pendentes"], 0)
+        self.assertEqual(estatisticas["concluidos"], 1)
+
+    @patch('app.routes.login.get_db')
+    def test_login_rehash_custo_diferente(self, mock_get_db):
+        """Login válido regrava o hash quando o custo configurado mudou"""
+        mock_get_db.return_value = self.db
+        self.app = create_app(testing=True)
+        servico_senhas.configurar(custo=4)
+
+        with self.app.test_client() as client:
+            response = client.post(
+                "/api/login",
+                data=json.dumps({"email": "user@email.com", "password": "123456"}),
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 200)
+
+        usuario = self.db.query(User).filter_by(email="user@email.com").first()
+        self.assertEqual(custo_do_hash(usuario.password_hash), 4)
+        self.assertTrue(usuario.check_password("123456"))
+
+    def test_calibrar_custo(self):
+        """Com alvo folgado a calibração recomenda o maior custo medido"""
+        recomendado, medicoes = calibrar_custo(alvo_ms=60000, minimo=4, maximo=5)
+        self.assertEqual(recomendado, 5)
+        self.assertEqual(sorted(medicoes), [4, 5])
+
+    @patch('app.routes.login.get_db')
+    def test_login_limite_por_conta(self, mock_get_db):
+        """Excedido o balde do e-mail, o login responde 429 sem consultar o banco"""
+        mock_get_db.return_value = self.db
+        self.app = create_app(testing=True)
+        limitador.regras['conta'] = (2, 1)
+
+        with self.app.test_client() as client:
+            for _ in range(2):
+                response = client.post(
+                    "/api/login",
+                    data=json.dumps({"email": "user@email.com", "password": "senha_errada"}),
+                    content_type="application/json",
+                )
+                self.assertEqual(response.status_code, 401)
+            chamadas = mock_get_db.call_count
+
+            response = client.post(
+                "/api/login",
+                data=json.dumps({"email": "USER@email.com", "password": "123456"}),
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(int(response.headers["Retry-After"]), 60)
+            self.assertEqual(mock_get_db.call_count, chamadas)
+
+            # Outra conta do mesmo IP continua liberada
+            response = client.post(
+                "/api/login",
+                data=json.dumps({"email": "outro@email.com", "password": "123456"}),
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 404)
+
+    def test_balde_repoe_fichas(self):
+        """O balde repõe fichas proporcionalmente ao tempo decorrido"""
+        create_app(testing=True)
+        self.assertEqual(limitador.consumir("teste", 1, 60, agora=1000.0), 0)
+        self.assertAlmostEqual(limitador.consumir("teste", 1, 60, agora=1000.5), 0.5)
+        self.assertEqual(limitador.consumir("teste", 1, 60, agora=1001.0), 0)
+
+    @patch('app.auth.get_db')
+    @patch('app.routes.login.get_db')
+    def test_conta_autenticada(self, mock_get_db, mock_auth_get_db):
+        """O token do login dá acesso à conta; a segunda requisição não consulta o banco"""
+        mock_get_db.return_value = self.db
+        mock_auth_get_db.return_value = self.db
+        self.app = create_app(testing=True)
+
+        with self.app.test_client() as client:
+            response = client.get("/api/conta")
+            self.assertEqual(response.status_code, 401)
+
+            response = client.get("/api/conta", headers={"Authorization": "Bearer invalido"})
+            self.assertEqual(response.status_code, 401)
+
+            response = client.post(
+                "/api/login",
+                data=json.dumps({"email": "user@email.com", "password": "123456"}),
+                content_type="application/json",
+            )
+            cabecalhos = {"Authorization": f"Bearer {response.json['token']}"}
+
+            response = client.get("/api/conta", headers=cabecalhos)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json["tipo"], "usuario")
+            self.assertEqual(response.json["email"], "user@email.com")
+            self.assertEqual(mock_auth_get_db.call_count, 1)
+
+            response = client.get("/api/conta", headers=cabecalhos)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(mock_auth_get_db.call_count, 1)
+
+            # Alterar a conta invalida a entrada carregada
+            usuario = self.db.query(User).filter_by(email="user@email.com").first()
+            usuario.name = "Nome Novo"
+            self.db.commit()
+            response = client.get("/api/conta", headers=cabecalhos)
+            self.assertEqual(response.json["name"], "Nome Novo")
+            self.assertEqual(mock_auth_get_db.call_count, 2)
+
+    @patch('app.routes.login.get_db')
+    def test_refresh_token_rotacao_e_reuso(self, mock_get_db):
+        """O refresh gera novos tokens; reutilizar um token já trocado revoga a família"""
+        mock_get_db.return_value = self.db
+        self.app = create_app(testing=True)
+
+        with self.app.test_client() as client:
+            response = client.post(
+                "/api/login",
+                data=json.dumps({"email": "user@email.com", "password": "123456"}),
+                content_type="application/json",
+            )
+            primeiro = response.json["refresh_token"]
+
+            with patch('app.passwords.servico_senhas.verificar') as mock_verificar:
+                response = client.post("/api/token/refresh", json={"refresh_token": primeiro})
+                self.assertEqual(response.status_code, 200)
+                self.assertIn("token", response.json)
+                mock_verificar.assert_not_called()
+            segundo = response.json["refresh_token"]
+            self.assertNotEqual(primeiro, segundo)
+
+            # Reuso do primeiro: rejeitado e o segundo deixa de valer
+            response = client.post("/api/token/refresh", json={"refresh_token": primeiro})
+            self.assertEqual(response.status_code, 401)
+            response = client.post("/api/token/refresh", json={"refresh_token": segundo})
+            self.assertEqual(response.status_code, 401)
+
+            response = client.post("/api/token/refresh", json={})
+            self.assertEqual(response.status_code, 400)
+
+    def test_remover_refresh_expirados(self):
+        """A limpeza remove apenas os refresh tokens vencidos"""
+        usuario = self.db.query(User).first()
+        emitir_refresh_token(self.db, usuario.id, "usuario", validade=timedelta(days=-1))
+        emitir_refresh_token(self.db, usuario.id, "usuario", validade=timedelta(days=-2))
+        emitir_refresh_token(self.db, usuario.id, "usuario")
+        self.db.commit()
+
+        self.assertEqual(remover_refresh_expirados(self.db, lote=1), 2)
+        self.assertEqual(self.db.query(RefreshToken).count(), 1)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
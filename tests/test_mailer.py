@@ -0,0 +1,187 @@
+import unittest
+import json
+import socketserver
+import threading
+from datetime import datetime
+from unittest.mock import patch
+from sqlalchemy.orm import sessionmaker
+from app import create_app, drop_test_db, test_engine
+from app.database import Base
+from app.mailer import enviador_emails
+from app.models.outbox import OutboxEmail, OutboxStatus, enfileirar_email
+from app.models.user import PendingUser
+from app import TestSession
+from app.rate_limit import limitador, arquivo_limites
+
+
+class ServidorSMTPLocal(socketserver.ThreadingTCPServer):
+    """Servidor SMTP mínimo para os testes: guarda as mensagens e recusa 'recusado@...'"""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), TratadorSMTP)
+        self.mensagens = []
+        self.conexoes = 0
+
+
+class TratadorSMTP(socketserver.StreamRequestHandler):
+    def responder(self, linha):
+        self.wfile.write((linha + '\r\n').encode())
+
+    def handle(self):
+        self.server.conexoes += 1
+        self.responder('220 teste')
+        destinatarios = []
+        while True:
+            linha = self.rfile.readline().decode().strip()
+            comando = linha[:4].upper()
+            if not linha or comando == 'QUIT':
+                self.responder('221 tchau')
+                return
+            if comando == 'RCPT':
+                if 'recusado@' in linha:
+                    self.responder('550 destinatario recusado')
+                    continue
+                destinatarios.append(linha.split(':', 1)[1].strip(' <>'))
+                self.responder('250 ok')
+            elif comando == 'DATA':
+                self.responder('354 envie')
+                corpo = []
+                while (parte := self.rfile.readline().decode()) != '.\r\n':
+                    corpo.append(parte)
+                self.server.mensagens.append((destinatarios, ''.join(corpo)))
+                destinatarios = []
+                self.responder('250 ok')
+            elif comando == 'RSET':
+                destinatarios = []
+                self.responder('250 ok')
+            else:
+                self.responder('250 ok')
+
+
+class MailerTestCase(unittest.TestCase):
+    def setUp(self):
+        """Configuração executada antes de cada teste"""
+        # Baldes do limitador cheios, no arquivo de testes deste processo
+        limitador.configurar(arquivo_limites(testing=True))
+        limitador.limpar(agora=float('inf'))
+        drop_test_db()
+        self.db = TestSession()
+        Base.metadata.create_all(bind=self.db.bind)
+
+        self.servidor = ServidorSMTPLocal()
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+        self.app = create_app(testing=True)
+        config = dict(self.app.config, MAIL_SERVER='127.0.0.1', MAIL_PORT=self.servidor.server_address[1],
+                      MAIL_USE_TLS=False, MAIL_PASSWORD=None)
+        enviador_emails.configurar(config, sessionmaker(bind=test_engine), lote=10, tentativas=2)
+        enviador_emails.enviados = enviador_emails.falhas = enviador_emails.conexoes = 0
+
+    def tearDown(self):
+        """Limpeza executada após cada teste"""
+        enviador_emails._fechar()
+        self.servidor.shutdown()
+        self.servidor.server_close()
+        self.db.close()
+        drop_test_db()
+
+    def test_envia_lote_em_uma_conexao(self):
+        """Os e-mails vencidos saem pela mesma conexão SMTP e ficam marcados como enviados"""
+        for i in range(3):
+            enfileirar_email(self.db, f"destino{i}@teste.com", f"Assunto {i}", "<b>Olá</b>")
+        self.db.commit()
+
+        self.assertEqual(enviador_emails.processar(), 3)
+
+        self.assertEqual(len(self.servidor.mensagens), 3)
+        self.assertEqual(self.servidor.conexoes, 1)
+        self.assertEqual(sorted(m[0][0] for m in self.servidor.mensagens),
+                         [f"destino{i}@teste.com" for i in range(3)])
+        self.assertIn("Subject: Assunto", self.servidor.mensagens[0][1])
+        self.db.expire_all()
+        self.assertEqual(self.db.query(OutboxEmail).filter_by(status=OutboxStatus.ENVIADO).count(), 3)
+
+        # Nada vencido: a rodada seguinte não reenvia
+        self.assertEqual(enviador_emails.processar(), 0)
+        self.assertEqual(len(self.servidor.mensagens), 3)
+
+    def test_falha_volta_para_fila_com_backoff(self):
+        """Destinatário recusado é reagendado e, esgotadas as tentativas, marcado como falho"""
+        enfileirar_email(self.db, "recusado@teste.com", "Assunto", "<b>Olá</b>")
+        enfileirar_email(self.db, "aceito@teste.com", "Assunto", "<b>Olá</b>")
+        self.db.commit()
+
+        enviador_emails.processar()
+
+        self.db.expire_all()
+        recusado = self.db.query(OutboxEmail).filter_by(recipient="recusado@teste.com").one()
+        self.assertEqual(recusado.status, OutboxStatus.PENDENTE)
+        self.assertEqual(recusado.attempts, 1)
+        self.assertGreater(recusado.next_attempt_at, datetime.utcnow())
+        self.assertEqual(len(self.servidor.mensagens), 1)
+
+        # Vence o backoff e esgota a segunda (última) tentativa
+        recusado.next_attempt_at = datetime.utcnow()
+        self.db.commit()
+        enviador_emails.processar()
+        self.db.expire_all()
+        recusado = self.db.query(OutboxEmail).filter_by(recipient="recusado@teste.com").one()
+        self.assertEqual(recusado.status, OutboxStatus.FALHOU)
+        self.assertEqual(recusado.attempts, 2)
+
+    def test_erro_em_um_email_nao_desfaz_os_enviados(self):
+        """Um e-mail que falha fora do SMTP volta para a fila; os já enviados ficam marcados"""
+        for destino in ("primeiro@teste.com", "quebrado@teste.com", "terceiro@teste.com"):
+            enfileirar_email(self.db, destino, "Assunto", "<b>Olá</b>")
+            self.db.commit()
+
+        mensagem = enviador_emails._mensagem
+        def montar(email):
+            if email.recipient == "quebrado@teste.com":
+                raise ValueError("cabeçalho inválido")
+            return mensagem(email)
+
+        with patch.object(enviador_emails, '_mensagem', side_effect=montar):
+            self.assertEqual(enviador_emails.processar(), 3)
+
+        self.db.expire_all()
+        situacao = {e.recipient: (e.status, e.attempts) for e in self.db.query(OutboxEmail)}
+        self.assertEqual(situacao, {
+            "primeiro@teste.com": (OutboxStatus.ENVIADO, 0),
+            "quebrado@teste.com": (OutboxStatus.PENDENTE, 1),
+            "terceiro@teste.com": (OutboxStatus.ENVIADO, 0),
+        })
+        self.assertEqual(len(self.servidor.mensagens), 2)
+
+    @patch('app.routes.user_routes.get_db')
+    def test_registro_grava_email_na_outbox(self, mock_get_db):
+        """O cadastro grava o pendente e o e-mail de confirmação no mesmo commit"""
+        mock_get_db.return_value = self.db
+
+        with self.app.test_client() as client:
+            response = client.post(
+                "/api/usuario/registrar",
+                data=json.dumps({
+                    "name": "Usuário Outbox",
+                    "address": "Rua Teste, 123",
+                    "phone": "12345678901",
+                    "cpf": "12345678901",
+                    "email": "outbox@teste.com",
+                    "password": "senha123"
+                }),
+                content_type="application/json"
+            )
+            self.assertEqual(response.status_code, 201)
+
+        self.assertIsNotNone(self.db.query(PendingUser).filter_by(email="outbox@teste.com").first())
+        email = self.db.query(OutboxEmail).filter_by(recipient="outbox@teste.com").one()
+        self.assertIn("/api/usuario/confirmar/", email.html)
+
+        enviador_emails.processar()
+        self.assertEqual(self.servidor.mensagens[0][0], ["outbox@teste.com"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,10 +7,19 @@ from app import create_app, drop_test_db
 from app.database import Base
 from app.models.user import User, PendingUser, UserDTO
 from app import TestSession
+from app.rate_limit import limitador, arquivo_limites
+from app.models.company import Company
+from app.models.refresh_token import RefreshToken, emitir_refresh_token
+from app.models.identity import Identity, IdentityKind
+from sqlalchemy.exc import IntegrityError
+from app.models.pending import remover_pendentes_expirados
 
 class UserRoutesTestCase(unittest.TestCase):
     def setUp(self):
         """Configuração executada antes de cada teste"""
+        # Baldes do limitador cheios, no arquivo de testes deste processo
+        limitador.configurar(arquivo_limites(testing=True))
+        limitador.limpar(agora=float('inf'))
         # Limpar o banco de dados de teste
         drop_test_db()
         
@@ -107,6 +116,63 @@ class UserRoutesTestCase(unittest.TestCase):
             self.assertEqual(response.status_code, 400)
             self.assertIn("já registrado", response.json["erro"])
     
+    @patch('app.routes.user_routes.get_db')
+    @patch('app.routes.user_routes.enviar_email')
+    def test_registrar_usuario_email_de_empresa(self, mock_enviar_email, mock_get_db):
+        """Teste do registro único de e-mails entre usuários e empresas"""
+        # Configurar o mock para retornar o banco de dados de teste
+        mock_get_db.return_value = self.db
+        
+        empresa = Company(
+            name="Empresa Teste",
+            address="Rua Empresa, 456",
+            phone="98765432109",
+            cnpj="12345678901234",
+            email="contato@teste.com",
+            password_hash="hash"
+        )
+        self.db.add(empresa)
+        self.db.commit()
+        
+        # Criar a aplicação de teste
+        self.app = create_app(testing=True)
+        
+        with self.app.test_client() as client:
+            dados_usuario = {
+                "name": "Usuário Teste",
+                "address": "Rua Teste, 123",
+                "phone": "12345678901",
+                "cpf": "12345678901",
+                "email": "Contato@Teste.com",
+                "password": "senha123"
+            }
+            response = client.post(
+                "/api/usuario/registrar",
+                data=json.dumps(dados_usuario),
+                content_type="application/json"
+            )
+            self.assertEqual(response.status_code, 400)
+            mock_enviar_email.assert_not_called()
+        
+        # O banco rejeita a duplicata mesmo sem a verificação da rota
+        self.db.add(User(name="Outro", email="contato@teste.com", password_hash="hash", role=3))
+        with self.assertRaises(IntegrityError):
+            self.db.commit()
+        self.db.rollback()
+        
+        # A confirmação de um cadastro troca o tipo do e-mail no registro
+        pendente = PendingUser(name="Pendente", email="pendente@teste.com", password_hash="hash")
+        self.db.add(pendente)
+        self.db.commit()
+        self.assertEqual(self.db.get(Identity, "pendente@teste.com").kind, IdentityKind.USUARIO_PENDENTE)
+        usuario = User(name="Pendente", email="pendente@teste.com", password_hash="hash", role=3)
+        self.db.add(usuario)
+        self.db.delete(pendente)
+        self.db.commit()
+        self.db.expire_all()
+        identidade = self.db.get(Identity, "pendente@teste.com")
+        self.assertEqual((identidade.kind, identidade.entity_id), (IdentityKind.USUARIO, usuario.id))
+    
     @patch('app.routes.user_routes.get_db')
     @patch('app.routes.user_routes.UserDTO.from_jwt')
     def test_confirmar_usuario(self, mock_from_jwt, mock_get_db):
@@ -243,6 +309,23 @@ class UserRoutesTestCase(unittest.TestCase):
             usuarios_pendentes = self.db.query(PendingUser).all()
             self.assertEqual(len(usuarios_pendentes), 1)
             self.assertEqual(usuarios_pendentes[0].email, "valido@teste.com")
+            self.assertEqual(response.json["removidos"], 1)
+
+    def test_remover_pendentes_expirados_em_lotes(self):
+        """A limpeza em lotes remove os pendentes vencidos e seus e-mails do registro"""
+        now = datetime.utcnow()
+        for i in range(5):
+            pendente = PendingUser(name=f"Pendente {i}", email=f"pendente{i}@teste.com",
+                                   cpf=f"0000000000{i}", password_hash="hash")
+            # O último ainda está dentro da carência de uma hora após expirar
+            pendente.expiration = now - timedelta(hours=2 if i < 4 else 0.5)
+            self.db.add(pendente)
+        self.db.commit()
+
+        self.assertEqual(remover_pendentes_expirados(self.db, PendingUser, lote=3), 4)
+
+        self.assertEqual([p.email for p in self.db.query(PendingUser).all()], ["pendente4@teste.com"])
+        self.assertEqual([i.email for i in self.db.query(Identity).all()], ["pendente4@teste.com"])
     
     @patch('app.routes.user_routes.get_db')
     def test_obter_usuario(self, mock_get_db):
@@ -279,6 +362,47 @@ class UserRoutesTestCase(unittest.TestCase):
             self.assertEqual(data["name"], "Usuário de Teste")
             self.assertEqual(data["email"], "usuario@teste.com")
     
+    @patch('app.routes.user_routes.get_db')
+    def test_obter_usuario_condicional(self, mock_get_db):
+        """Teste de GET condicional (ETag/Last-Modified) ao obter usuário"""
+        # Configurar o mock para retornar o banco de dados de teste
+        mock_get_db.return_value = self.db
+        
+        usuario = User(
+            name="Usuário Condicional",
+            email="condicional@teste.com",
+            password_hash=hashpw("senha123".encode('utf-8'), gensalt()).decode('utf-8'),
+            role=0
+        )
+        self.db.add(usuario)
+        self.db.commit()
+        
+        # Criar a aplicação de teste
+        self.app = create_app(testing=True)
+        
+        with self.app.test_client() as client:
+            response = client.get(f"/api/usuario/obter/{usuario.id}")
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers["ETag"]
+            last_modified = response.headers["Last-Modified"]
+            
+            # Sem alterações: 304 sem corpo
+            response = client.get(f"/api/usuario/obter/{usuario.id}", headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b"")
+            response = client.get(
+                f"/api/usuario/obter/{usuario.id}",
+                headers={"If-Modified-Since": last_modified}
+            )
+            self.assertEqual(response.status_code, 304)
+            
+            # Após alteração o ETag muda
+            usuario.name = "Nome Alterado"
+            self.db.commit()
+            response = client.get(f"/api/usuario/obter/{usuario.id}", headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json["name"], "Nome Alterado")
+    
     @patch('app.routes.user_routes.get_db')
     def test_find_by_substring(self, mock_get_db):
         """Teste para buscar usuários por substring no nome"""
@@ -336,6 +460,49 @@ class UserRoutesTestCase(unittest.TestCase):
             self.assertIn("José Silva", nomes)
             self.assertNotIn("Maria Oliveira", nomes)
     
+    @patch('app.routes.user_routes.get_db')
+    def test_find_by_substring_sem_acentos(self, mock_get_db):
+        """Teste da busca por substring sem diferenciar acentos e maiúsculas"""
+        # Configurar o mock para retornar o banco de dados de teste
+        mock_get_db.return_value = self.db
+        
+        for i, nome in enumerate(["Ana Josefina", "José", "Maria José Souza", "Pedro"]):
+            self.db.add(User(
+                name=nome,
+                email=f"usuario{i}@teste.com",
+                password_hash="hash",
+                role=3
+            ))
+        self.db.commit()
+        
+        # Criar a aplicação de teste
+        self.app = create_app(testing=True)
+        
+        with self.app.test_client() as client:
+            # Nome idêntico primeiro, depois pela posição do termo
+            response = client.get("/api/usuarios/find_by_substring/JOSE")
+            self.assertEqual(response.status_code, 200)
+            nomes = [u["name"] for u in response.json]
+            self.assertEqual(nomes, ["José", "Ana Josefina", "Maria José Souza"])
+            
+            # Limite de resultados
+            response = client.get("/api/usuarios/find_by_substring/jose?limit=1")
+            self.assertEqual(len(response.json), 1)
+            
+            # Termos curtos buscam por prefixo
+            response = client.get("/api/usuarios/find_by_substring/pe")
+            self.assertEqual([u["name"] for u in response.json], ["Pedro"])
+            
+            # Alteração do nome atualiza o índice
+            pedro = self.db.query(User).filter_by(name="Pedro").one()
+            pedro.name = "Pedro Álvares"
+            self.db.commit()
+            response = client.get("/api/usuarios/find_by_substring/alvares")
+            self.assertEqual([u["name"] for u in response.json], ["Pedro Álvares"])
+            
+            response = client.get("/api/usuarios/find_by_substring/jose?limit=0")
+            self.assertEqual(response.status_code, 400)
+    
     @patch('app.routes.user_routes.get_db')
     def test_nova_senha(self, mock_get_db):
         """Teste para alterar a senha de um usuário"""
@@ -358,6 +525,11 @@ class UserRoutesTestCase(unittest.TestCase):
         
         self.db.add(usuario)
         self.db.commit()
+
+        # Duas sessões abertas com a senha antiga (famílias distintas)
+        for _ in range(2):
+            emitir_refresh_token(self.db, usuario.id, IdentityKind.USUARIO)
+        self.db.commit()
         
         # Criar a aplicação de teste
         self.app = create_app(testing=True)
@@ -388,5 +560,10 @@ class UserRoutesTestCase(unittest.TestCase):
                 checkpw(senha_original.encode('utf-8'), usuario_atualizado.password_hash.encode('utf-8'))
             )
 
+            # Os refresh tokens da senha antiga foram revogados
+            self.db.expire_all()
+            self.assertEqual(self.db.query(RefreshToken).filter(RefreshToken.revoked_at.is_(None)).count(), 0)
+            self.assertEqual(self.db.query(RefreshToken).count(), 2)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file